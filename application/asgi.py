@@ -0,0 +1,16 @@
+"""
+ASGI config for manger project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+"""
+
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "application.settings")
+django.setup(set_prefix=False)
+
+from manger.asgi import ASGIHandler  # noqa: E402
+
+application = ASGIHandler()
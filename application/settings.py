@@ -27,6 +27,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Addresses allowed to read /metrics/
+INTERNAL_IPS = ['127.0.0.1']
+
 
 # Application definition
 
@@ -38,10 +41,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'manger',
+    'manger.apps.MangerConfig',
 ]
 
 MIDDLEWARE = [
+    'manger.metrics.MetricsMiddleware',
+    'manger.api.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,14 +80,156 @@ WSGI_APPLICATION = 'application.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
 
-DATABASES = {
+# MANGER_DB_ENGINE selects SQLite (default) or PostgreSQL (needs psycopg2); connections are
+# kept open for MANGER_DB_CONN_MAX_AGE seconds. List views read from the
+# 'replica' alias when MANGER_DB_REPLICA_HOST (PostgreSQL) or
+# MANGER_DB_REPLICA=1 (SQLite: a read-only connection to the same file) is set.
+
+DATABASE_ENGINE = os.environ.get('MANGER_DB_ENGINE', 'sqlite')
+CONN_MAX_AGE = int(os.environ.get('MANGER_DB_CONN_MAX_AGE', 600))
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('MANGER_DB_NAME', 'manger'),
+            'USER': os.environ.get('MANGER_DB_USER', 'manger'),
+            'PASSWORD': os.environ.get('MANGER_DB_PASSWORD', ''),
+            'HOST': os.environ.get('MANGER_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('MANGER_DB_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+        }
+    }
+    if os.environ.get('MANGER_DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['MANGER_DB_REPLICA_HOST'],
+            'PORT': os.environ.get('MANGER_DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASE_PATH = os.environ.get('MANGER_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': DATABASE_PATH,
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            # wait for the write lock instead of failing with "database is locked"
+            'OPTIONS': {'timeout': 20},
+        }
+    }
+    if os.environ.get('MANGER_DB_REPLICA'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': 'file:%s?mode=ro' % DATABASE_PATH,
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = ['manger.db.ReplicaRouter']
+
+MANGER_DB_REPLICA = 'replica' if 'replica' in DATABASES else None
+
+# Applied to every new SQLite connection, in order.
+MANGER_SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -32000),
+    ('mmap_size', 268435456),
+    ('temp_store', 'MEMORY'),
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Versions of cached API responses live here and are bumped by the server and
+# by management commands alike, so every process must share one backend.
+# The file-based cache works out of the box; switch to memcached or redis when
+# the workers run on several hosts.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('MANGER_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
     }
 }
 
 
+# REST framework
+# Clients pick MessagePack with `Accept: application/msgpack`; adding
+# `; layout=columns` to either media type returns lists as one array per field.
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'manger.api.renderers.JSONRenderer',
+        'manger.api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+
+# Compression
+# API responses of at least this many bytes are sent with brotli (when the
+# brotli package is installed) or gzip, whichever the client accepts.
+
+MANGER_COMPRESS_MIN_SIZE = 1024
+
+
+# Metrics
+# Share of requests for which SQL queries are counted and timed;
+# latency and response size are recorded for every request.
+
+MANGER_METRICS_SAMPLE_RATE = 1.0
+
+
+# Journal ingestion queue
+# POST /manger/journal/queue/ stores writes in this local SQLite file and a
+# writer thread applies them in batches. With several worker processes set
+# MANGER_INGEST_THREAD = False and run one `manage.py ingest_writer` instead.
+
+MANGER_INGEST_QUEUE = os.path.join(BASE_DIR, 'ingest.sqlite3')
+MANGER_INGEST_BATCH_SIZE = 500
+MANGER_INGEST_THREAD = True
+
+
+# Journal archive
+# `manage.py archive_journal` moves visits closed more than this many days
+# ago to the archive table; list endpoints read it only with ?archive=true.
+
+MANGER_ARCHIVE_AFTER_DAYS = 365
+
+
+# Baby photo thumbnails
+# Baby.photo is a path under MANGER_PHOTO_ROOT. Square thumbnails of each of
+# MANGER_THUMBNAIL_SIZES pixels are made on first request by a pool of
+# MANGER_THUMBNAIL_WORKERS processes and kept in MANGER_THUMBNAIL_CACHE;
+# the least recently read ones are removed above MANGER_THUMBNAIL_CACHE_SIZE bytes.
+# Thumbnail URLs carry the photo version; only URLs with the current version
+# are cached for MANGER_THUMBNAIL_MAX_AGE seconds, others are revalidated.
+
+MANGER_PHOTO_ROOT = os.path.join(BASE_DIR, 'photos')
+MANGER_THUMBNAIL_CACHE = os.path.join(BASE_DIR, 'thumbnails')
+MANGER_THUMBNAIL_CACHE_SIZE = 256 * 1024 * 1024
+MANGER_THUMBNAIL_SIZES = (64, 128, 256)
+MANGER_THUMBNAIL_WORKERS = 2
+MANGER_THUMBNAIL_MAX_AGE = 30 * 24 * 60 * 60
+
+
+# Baby cache
+# Babies are kept in process memory for this many seconds; writes in the same
+# process clear it at once, writes from other processes show up after the TTL.
+
+MANGER_BABY_CACHE_TTL = 60
+
+
+# ASGI
+# application/asgi.py serves the API from an event loop: feed long-polls and
+# event streams wait there without a thread, other requests run in a pool of
+# this many threads. Run it with any ASGI server, e.g.
+# `uvicorn application.asgi:application`.
+
+MANGER_ASGI_THREADS = 32
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
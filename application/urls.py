@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from manger.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('manger/', include('manger.urls')),
+    path('metrics/', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,174 @@
+"""
+Аналитика посещений за диапазон дней на NumPy.
+
+Посещения диапазона читаются одним запросом — время прибытия и ухода сразу
+секундами эпохи, без создания datetime на каждую строку, — и дальше
+считаются операциями над массивами: заполненность по 15-минутным слотам
+через разностный массив по интервалам, средняя длительность по классам и
+число прибытий по сопровождающим через ``unique`` и ``bincount``. Результат кешируется
+по диапазону и версии данных ``SyncVersion``, поэтому любая запись в журнал
+делает кеш неактуальным.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F, FloatField, Func
+from django.utils import timezone
+
+from manger.models import Journal, JournalArchive, SyncVersion
+
+SLOT_SECONDS = 15 * 60
+SLOTS_PER_DAY = 24 * 60 * 60 // SLOT_SECONDS
+CACHE_TIMEOUT = 60 * 60
+LIVE_CACHE_TIMEOUT = 60
+
+
+class Epoch(Func):
+    """
+    Секунды эпохи (UTC) для колонки с датой и временем.
+    """
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='EXTRACT(EPOCH FROM %(expressions)s)::double precision', **extra_context
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='(julianday(%(expressions)s) - 2440587.5) * 86400.0', **extra_context
+        )
+
+
+def day_starts(date_from, date_to):
+    """
+    Начала местных суток с ``date_from`` по ``date_to + 1`` секундами эпохи.
+    """
+    days = (date_to - date_from).days + 2
+    starts = [datetime.combine(date_from + timedelta(days=i), time.min) for i in range(days)]
+    if settings.USE_TZ:
+        starts = [timezone.make_aware(start) for start in starts]
+    else:
+        starts = [start.replace(tzinfo=timezone.utc) for start in starts]
+    return np.array([start.timestamp() for start in starts])
+
+
+def load(starts):
+    """
+    Массивы ``(прибытие, уход, сопровождающий, класс)`` по посещениям с
+    прибытием в диапазоне, все ``float64``; NULL — ``nan``.
+    """
+    # только выражения: их порядок в SELECT совпадает с порядком здесь
+    columns = (Epoch('income_time'), Epoch('outcome_time'), F('income_escort'), F('baby__grade'))
+    lookups = {
+        'income_time__gte': datetime.fromtimestamp(starts[0], timezone.utc),
+        'income_time__lt': datetime.fromtimestamp(starts[-1], timezone.utc),
+    }
+    queryset = Journal.objects.filter(**lookups).values_list(*columns)
+    if lookups['income_time__gte'] < timezone.now() - timedelta(days=settings.MANGER_ARCHIVE_AFTER_DAYS):
+        queryset = queryset.union(JournalArchive.objects.filter(**lookups).values_list(*columns), all=True)
+
+    # строки читаются курсором напрямую: без конвертеров полей Django на каждое значение
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    # None превращается в nan
+    data = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    return data[:, 0], data[:, 1], data[:, 2], data[:, 3]
+
+
+def occupancy(income, outcome, starts, now):
+    """
+    Число детей на месте по слотам каждого дня, массив ``дни x слоты``.
+    Незакрытое посещение длится до ``now``; посещение до следующих суток
+    обрезается концом дня прибытия.
+    """
+    days = len(starts) - 1
+    day = np.searchsorted(starts, income, side='right') - 1
+    day_start = starts[day]
+    end = np.where(np.isnan(outcome), now, outcome)
+    end = np.minimum(end, starts[day + 1])
+
+    first = ((income - day_start) // SLOT_SECONDS).astype(np.int64)
+    last = np.ceil((end - day_start) / SLOT_SECONDS).astype(np.int64)
+    first = np.clip(first, 0, SLOTS_PER_DAY)
+    last = np.clip(last, first, SLOTS_PER_DAY)
+
+    diff = np.zeros((days, SLOTS_PER_DAY + 1), dtype=np.int64)
+    np.add.at(diff, (day, first), 1)
+    np.add.at(diff, (day, last), -1)
+    return np.cumsum(diff, axis=1)[:, :SLOTS_PER_DAY]
+
+
+def group(keys, weights):
+    """
+    ``(ключ, число, сумма весов)`` по значениям ``keys`` в порядке
+    возрастания; NULL (``nan``) — отдельная группа с ключом ``None``, первая.
+    Значения могут быть любыми целыми, в том числе отрицательными.
+    """
+    null = np.isnan(keys)
+    groups = []
+    if null.any():
+        groups.append((None, int(null.sum()), float(weights[null].sum())))
+
+    values, inverse = np.unique(keys[~null], return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(values))
+    sums = np.bincount(inverse, weights=weights[~null], minlength=len(values))
+    groups.extend((int(value), int(count), float(total)) for value, count, total in zip(values, counts, sums))
+    return groups
+
+
+def compute(date_from, date_to, now=None):
+    now = (now or timezone.now()).timestamp()
+    starts = day_starts(date_from, date_to)
+    income, outcome, escort, grade = load(starts)
+
+    counts = occupancy(income, outcome, starts, now)
+    # средняя заполненность — по дням, когда кто-то был
+    open_days = counts.any(axis=1)
+    average = counts[open_days].mean(axis=0) if open_days.any() else np.zeros(SLOTS_PER_DAY)
+    peak = counts.max(axis=0)
+
+    closed = ~np.isnan(outcome)
+    minutes = (outcome[closed] - income[closed]) / 60
+
+    return {
+        'date_from': str(date_from),
+        'date_to': str(date_to),
+        'visits': int(len(income)),
+        'days': int(open_days.sum()),
+        'occupancy': [
+            {
+                'time': '%02d:%02d' % divmod(slot * SLOT_SECONDS // 60, 60),
+                'average': round(float(average[slot]), 2),
+                'max': int(peak[slot]),
+            }
+            for slot in range(SLOTS_PER_DAY)
+        ],
+        'stay_by_grade': [
+            {'grade': key, 'visits': count, 'average_minutes': round(total / count, 1)}
+            for key, count, total in group(grade[closed], minutes)
+        ],
+        'arrivals_by_escort': [
+            {'income_escort': key, 'count': count}
+            for key, count, _ in group(escort, np.ones(len(escort)))
+        ],
+    }
+
+
+def get(date_from, date_to):
+    version = SyncVersion.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+    key = 'manger:analytics:%s:%s:%d' % (date_from, date_to, version)
+
+    result = cache.get(key)
+    if result is None:
+        result = compute(date_from, date_to)
+        # незакрытые посещения сегодняшнего дня растут и без записей в журнал
+        live = date_to >= timezone.localdate()
+        cache.set(key, result, LIVE_CACHE_TIMEOUT if live else CACHE_TIMEOUT)
+    return result
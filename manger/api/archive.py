@@ -0,0 +1,20 @@
+from manger.api.filters import get_bool_param
+from manger.models import JournalArchive
+
+
+class ArchiveListMixin:
+    """
+    ``?archive=true`` добавляет в список записи из ``JournalArchive`` с теми
+    же фильтрами и сериализацией; по умолчанию читается только журнал.
+    Ставится перед ``RowListMixin``.
+    """
+    archive_query_param = 'archive'
+
+    def get_archive_queryset(self):
+        return JournalArchive.objects.all()
+
+    def get_list_querysets(self):
+        querysets = super().get_list_querysets()
+        if get_bool_param(self.request.query_params, self.archive_query_param):
+            querysets.append(self.filter_queryset(self.get_archive_queryset()))
+        return querysets
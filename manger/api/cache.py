@@ -0,0 +1,103 @@
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class VersionedCache:
+    """
+    Кеш ответов, привязанный к версии ресурса.
+
+    Версия (случайный токен + время изменения) лежит в кеше Django и
+    меняется при каждом сохранении или удалении модели (``on_change``
+    подключен к ее сигналам в ``MangerConfig.ready``) — старые ответы
+    перестают находиться по ключу, а клиенты получают новый ETag. Версию
+    меняют и читают разные процессы, поэтому бэкенд кеша должен быть общим
+    (см. ``CACHES`` в настройках).
+    """
+    timeout = 60 * 60
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = 'manger:%s:version' % name
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, self.make_version(), None)
+            version = cache.get(self.version_key) or self.make_version()
+        return version
+
+    def bump(self):
+        cache.set(self.version_key, self.make_version(self.get_version()), None)
+
+    def on_change(self, sender, instance, **kwargs):
+        self.bump()
+        # чтение между сменой версии и коммитом могло закешировать старые данные под новой версией
+        transaction.on_commit(self.bump)
+
+    @staticmethod
+    def make_version(previous=None):
+        # время изменения строго растет: If-Modified-Since сравнивается с точностью до секунды
+        modified = int(time.time())
+        if previous is not None and modified <= previous[1]:
+            modified = previous[1] + 1
+        return uuid.uuid4().hex, modified
+
+    def get_response_key(self, token, request):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return 'manger:%s:%s:%s' % (self.name, token, path)
+
+    @staticmethod
+    def is_not_modified(request, etag, modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags or etag[2:] in etags
+
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return if_modified_since is not None and modified <= if_modified_since
+
+    def respond(self, request, handler):
+        token, modified = self.get_version()
+        etag = 'W/"%s"' % token
+
+        if self.is_not_modified(request, etag, modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = self.get_response_key(token, request)
+            data = cache.get(key)
+            if data is None:
+                response = handler()
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data, self.timeout)
+            else:
+                response = Response(data)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        return response
+
+
+class VersionedCacheMixin:
+    """
+    Кеширует list/retrieve вьюсета и отвечает 304 на условные запросы.
+    Версию меняют сигналы модели, а не вьюсет: так видны и записи из команд
+    и админки.
+    """
+    versioned_cache = None
+
+    def list(self, request, *args, **kwargs):
+        return self.versioned_cache.respond(request, lambda: super(VersionedCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.versioned_cache.respond(request, lambda: super(VersionedCacheMixin, self).retrieve(request, *args, **kwargs))
+
+
+babies_cache = VersionedCache('babies')
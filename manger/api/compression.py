@@ -0,0 +1,112 @@
+"""
+Сжатие ответов API.
+
+Ответы под префиксом API больше ``MANGER_COMPRESS_MIN_SIZE`` байт сжимаются
+brotli, если клиент его принимает и пакет ``brotli`` установлен, иначе gzip.
+Потоковые ответы (выгрузка журнала) сжимаются по частям без ограничения по
+размеру. Не сжимаются поток событий ``text/event-stream`` — события должны
+уходить клиенту сразу — и картинки, которые уже сжаты.
+"""
+import gzip
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SKIP_CONTENT_TYPES = ('text/event-stream', 'image/')
+GZIP_LEVEL = 6
+# для ответов, которые сжимаются на каждый запрос, качество 11 слишком медленное
+BROTLI_QUALITY = 5
+
+
+def accepted_encodings(header):
+    """
+    Кодировки из ``Accept-Encoding`` с ненулевым ``q``.
+    """
+    encodings = set()
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name)
+    return encodings
+
+
+def choose_encoding(header):
+    encodings = accepted_encodings(header)
+    if brotli is not None and ('br' in encodings or '*' in encodings):
+        return 'br'
+    if 'gzip' in encodings or '*' in encodings:
+        return 'gzip'
+    return None
+
+
+def compress_brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = None
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if self.prefix is None:
+            self.prefix = reverse('api-root')
+        if not request.path.startswith(self.prefix) or response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').startswith(SKIP_CONTENT_TYPES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = compress_brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.MANGER_COMPRESS_MIN_SIZE:
+                return response
+            content = compress(response.content, encoding)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # сжатое тело уже не совпадает байт в байт с несжатым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,16 @@
+from rest_framework import serializers
+
+from manger import thumbnails
+
+
+class ThumbnailsField(serializers.ReadOnlyField):
+    """
+    Ссылки на миниатюры фото по размерам: ``{"64": "/manger/thumbnails/64/...?v=..."}``.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'photo')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return thumbnails.get_urls(value)
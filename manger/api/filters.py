@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.utils.dateparse import parse_date
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+from manger.models import DailyAttendance, Journal
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_date_param(params, name):
+    if name not in params:
+        return None
+
+    try:
+        value = parse_date(params[name])
+    except ValueError:
+        value = None
+    if value is None:
+        raise serializers.ValidationError({name: ['Date has wrong format. Use YYYY-MM-DD']})
+    return value
+
+
+def get_bool_param(params, name):
+    if name not in params:
+        return None
+
+    value = params[name].lower()
+    if value in ('1', 'true'):
+        return True
+    if value in ('0', 'false'):
+        return False
+    raise serializers.ValidationError({name: ['Must be a valid boolean']})
+
+
+def get_int_list_param(params, name):
+    if name not in params:
+        return None
+
+    values = [to_int(value) for value in params[name].split(',')]
+    if None in values:
+        raise serializers.ValidationError({name: ['A comma-separated list of integers is required']})
+    return values
+
+
+def get_choice_param(params, name, choices):
+    value = get_int_list_param(params, name)
+    if value is not None and len(value) == 1 and value[0] in dict(choices):
+        return value[0]
+    if value is not None:
+        raise serializers.ValidationError({name: ['Expected one of: %s' % ', '.join(str(key) for key, _ in choices)]})
+    return None
+
+
+class JournalFilterBackend(BaseFilterBackend):
+    """
+    Фильтры журнала, которые база выполняет по индексам:
+
+    * ``baby`` — id ребенка или список через запятую, индекс (baby, income_time);
+    * ``date_from``, ``date_to`` — день прибытия включительно, индекс (income_time, id);
+    * ``grade`` — класс ребенка;
+    * ``income_escort`` — кто привел.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        baby_ids = get_int_list_param(params, 'baby')
+        if baby_ids is not None:
+            queryset = queryset.filter(baby_id__in=baby_ids) if len(baby_ids) > 1 else queryset.filter(baby_id=baby_ids[0])
+
+        date_from, date_to = get_date_param(params, 'date_from'), get_date_param(params, 'date_to')
+        if date_from is not None:
+            queryset = queryset.filter(income_time__gte=DailyAttendance.day_start(date_from))
+        if date_to is not None:
+            queryset = queryset.filter(income_time__lt=DailyAttendance.day_start(date_to + timedelta(days=1)))
+
+        grades = get_int_list_param(params, 'grade')
+        if grades is not None:
+            queryset = queryset.filter(baby__grade__in=grades)
+
+        income_escort = get_choice_param(params, 'income_escort', Journal.ESCORT_CHOICES)
+        if income_escort is not None:
+            queryset = queryset.filter(income_escort=income_escort)
+
+        return queryset
@@ -0,0 +1,209 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class JournalCursorPagination(BasePagination):
+    """
+    Keyset-пагинация журнала по (income_time, id).
+
+    Курсор хранит ключ последней (или первой) записи страницы, поэтому
+    каждая страница — это один индексный поиск без OFFSET.
+    Записи без income_time идут в начале.
+
+    Вместо queryset можно передать список querysets (например, журнал и
+    архив): страница набирается из каждого и сливается по ключу.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    key_fields = ('income_time', 'id')
+
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            reverse, key = False, None
+        else:
+            reverse, key = cursor
+
+        limit = self.page_size + 1
+        sources = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+        results = []
+        for source in sources:
+            rows = []
+            for segment in self.get_segments(source, key, reverse):
+                rows.extend(segment[:limit - len(rows)])
+                if len(rows) >= limit:
+                    break
+            results.extend(rows)
+
+        if len(sources) > 1:
+            results.sort(key=self.sort_key, reverse=reverse)
+            del results[limit:]
+
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = key is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = key is not None
+
+        return self.page
+
+    @staticmethod
+    def sort_key(record):
+        # порядок сегментов: сначала записи без income_time
+        if record.income_time is None:
+            return 0, 0, record.id
+        return 1, record.income_time, record.id
+
+    def get_segments(self, queryset, key, reverse):
+        """
+        Записи без income_time и с ним выбираются отдельными запросами:
+        так каждый из них идет по индексу с простым ORDER BY, без
+        NULLS FIRST, который не все базы умеют брать из индекса.
+        """
+        income_time, pk = key if key is not None else (None, None)
+        empty = queryset.filter(income_time__isnull=True)
+        filled = queryset.filter(income_time__isnull=False)
+
+        if not reverse:
+            if key is None:
+                return [empty.order_by('id'), filled.order_by('income_time', 'id')]
+            if income_time is None:
+                return [empty.filter(id__gt=pk).order_by('id'), filled.order_by('income_time', 'id')]
+            filled = filled.filter(Q(income_time__gt=income_time) | Q(id__gt=pk), income_time__gte=income_time)
+            return [filled.order_by('income_time', 'id')]
+
+        if income_time is None:
+            return [empty.filter(id__lt=pk).order_by('-id')]
+        filled = filled.filter(Q(income_time__lt=income_time) | Q(id__lt=pk), income_time__lte=income_time)
+        return [filled.order_by('-income_time', '-id'), empty.order_by('-id')]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            pk = int(tokens['i'][0])
+            income_time = tokens.get('t', [''])[0]
+            if income_time:
+                income_time = parse_datetime(income_time)
+                if income_time is None:
+                    raise ValueError
+            else:
+                income_time = None
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, (income_time, pk)
+
+    def encode_cursor(self, reverse, record):
+        tokens = {'i': record.id}
+        if reverse:
+            tokens['r'] = 1
+        if record.income_time is not None:
+            tokens['t'] = record.income_time.isoformat()
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class DailyAttendanceCursorPagination(JournalCursorPagination):
+    """
+    Keyset-пагинация дневных сводок по (date, baby_id). Обе колонки
+    не NULL, поэтому каждая страница — один запрос.
+    """
+    key_fields = ('date', 'baby_id')
+
+    @staticmethod
+    def sort_key(record):
+        return record.date, record.baby_id
+
+    def get_segments(self, queryset, key, reverse):
+        if key is None:
+            return [queryset.order_by('date', 'baby_id')]
+
+        date, baby_id = key
+        if not reverse:
+            queryset = queryset.filter(Q(date__gt=date) | Q(baby_id__gt=baby_id), date__gte=date)
+            return [queryset.order_by('date', 'baby_id')]
+        queryset = queryset.filter(Q(date__lt=date) | Q(baby_id__lt=baby_id), date__lte=date)
+        return [queryset.order_by('-date', '-baby_id')]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            baby_id = int(tokens['b'][0])
+            date = parse_date(tokens['d'][0])
+            if date is None:
+                raise ValueError
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, (date, baby_id)
+
+    def encode_cursor(self, reverse, record):
+        tokens = {'d': record.date.isoformat(), 'b': record.baby_id}
+        if reverse:
+            tokens['r'] = 1
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
@@ -0,0 +1,85 @@
+"""
+Форматы ответов API: JSON и MessagePack, построчно или по колонкам.
+
+Параметр ``layout=columns`` в ``Accept`` (``application/json; layout=columns``,
+``application/msgpack; layout=columns``) превращает список записей — весь
+ответ или ``results`` страницы — в словарь «поле -> массив значений»: имена
+полей передаются один раз, а не в каждой записи.
+"""
+import msgpack
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+COLUMNS = 'columns'
+
+
+def get_layout(accepted_media_type):
+    """
+    Значение параметра ``layout`` или ``None``. Разбирается строка как есть:
+    в параметрах ``Accept`` может оказаться что угодно, а незнакомое значение
+    просто оставляет построчный формат.
+    """
+    if not accepted_media_type:
+        return None
+    for param in accepted_media_type.split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'layout':
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            return value or None
+    return None
+
+
+def to_columns(data):
+    """
+    Список словарей — в словарь колонок; у страницы преобразуется ``results``.
+    Остальные ответы (одна запись, ошибки) возвращаются как есть.
+    """
+    if isinstance(data, dict):
+        if isinstance(data.get('results'), list):
+            return {**data, 'results': to_columns(data['results'])}
+        return data
+
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        return data
+
+    names = list(data[0]) if data else []
+    return {name: [row.get(name) for row in data] for name in names}
+
+
+class LayoutMixin:
+    def get_data(self, data, accepted_media_type):
+        if get_layout(accepted_media_type) == COLUMNS:
+            return to_columns(data)
+        return data
+
+
+class JSONRenderer(LayoutMixin, renderers.JSONRenderer):
+    def get_indent(self, accepted_media_type, renderer_context):
+        try:
+            return super().get_indent(accepted_media_type, renderer_context)
+        except UnicodeEncodeError:
+            # DRF разбирает параметры Accept только в ASCII
+            return renderer_context.get('indent')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(self.get_data(data, accepted_media_type), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(LayoutMixin, renderers.BaseRenderer):
+    """
+    MessagePack; даты и прочие типы без представления в MessagePack
+    кодируются так же, как в JSON.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    encoder = encoders.JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(self.get_data(data, accepted_media_type), default=self.encoder.default)
@@ -0,0 +1,145 @@
+from itertools import chain
+
+from django.utils import timezone
+from rest_framework import fields, relations
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+from manger.api.fields import ThumbnailsField
+
+IDENTITY_FIELDS = (
+    fields.BooleanField,
+    fields.CharField,
+    fields.ChoiceField,
+    fields.IntegerField,
+    fields.NullBooleanField,
+    relations.PrimaryKeyRelatedField,
+)
+
+
+def make_datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None:
+        return None
+
+    field_timezone = getattr(field, 'timezone', field.default_timezone())
+    iso = output_format.lower() == ISO_8601
+
+    def convert(value):
+        if not value:
+            return None
+
+        if field_timezone is not None:
+            # значения из базы обычно уже в нужной зоне
+            if value.tzinfo is not field_timezone:
+                if timezone.is_aware(value):
+                    value = value.astimezone(field_timezone)
+                else:
+                    value = timezone.make_aware(value, field_timezone)
+        elif timezone.is_aware(value):
+            value = timezone.make_naive(value, timezone.utc)
+
+        if iso:
+            value = value.isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return value.strftime(output_format)
+
+    return convert
+
+
+def make_date_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None:
+        return None
+
+    if output_format.lower() == ISO_8601:
+        return lambda value: value.isoformat() if value else None
+    return lambda value: value.strftime(output_format) if value else None
+
+
+class RowSerializer:
+    """
+    Сериализация списков прямо из ``values_list``.
+
+    Для каждого поля сериализатора заранее выбирается конвертер, повторяющий
+    ``to_representation`` DRF, поэтому JSON совпадает с обычным путем
+    байт в байт, но без создания моделей и полей на каждую строку.
+    Поля, для которых конвертера нет, делают сериализатор неподдерживаемым.
+    Несколько полей с одним источником читают одну колонку.
+    """
+
+    def __init__(self, serializer):
+        self.names, self.columns, self.indexes, self.converters = [], [], [], []
+        self.supported = True
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+
+            if isinstance(field, fields.DateTimeField):
+                converter = make_datetime_converter(field)
+            elif isinstance(field, fields.DateField):
+                converter = make_date_converter(field)
+            elif isinstance(field, ThumbnailsField):
+                converter = field.to_representation
+            elif isinstance(field, IDENTITY_FIELDS) and '.' not in field.source and field.source != '*':
+                converter = None
+            else:
+                self.supported = False
+                return
+
+            if field.source not in self.columns:
+                self.columns.append(field.source)
+            self.names.append(name)
+            self.indexes.append(self.columns.index(field.source))
+            self.converters.append(converter)
+
+    def get_queryset(self, queryset, extra=()):
+        """
+        Колонки ``extra`` (например, ключ пагинации) читаются, но в ответ не попадают.
+        """
+        extra = [column for column in extra if column not in self.columns]
+        return queryset.values_list(*self.columns, *extra, named=True)
+
+    def serialize(self, rows):
+        names = self.names
+        converters = [
+            (i, converter) for i, converter in enumerate(self.converters) if converter is not None
+        ]
+        # без повторных колонок порядок значений строки совпадает с полями
+        indexes = None if len(self.columns) == len(names) else self.indexes
+
+        data = []
+        for row in rows:
+            values = list(row) if indexes is None else [row[i] for i in indexes]
+            for i, converter in converters:
+                values[i] = converter(values[i])
+            data.append(dict(zip(names, values)))
+        return data
+
+
+class RowListMixin:
+    """
+    Быстрый путь для ``list``: чтение через ``values_list`` и сериализация
+    ``RowSerializer``. Если поля сериализатора не поддерживаются,
+    используется обычный ``list``.
+    """
+
+    def get_list_querysets(self):
+        return [self.filter_queryset(self.get_queryset())]
+
+    def list(self, request, *args, **kwargs):
+        rows = RowSerializer(self.get_serializer())
+        if not rows.supported:
+            return super().list(request, *args, **kwargs)
+
+        extra = getattr(self.paginator, 'key_fields', ())
+        querysets = [rows.get_queryset(queryset, extra=extra) for queryset in self.get_list_querysets()]
+
+        page = self.paginate_queryset(querysets[0] if len(querysets) == 1 else querysets)
+        if page is not None:
+            return self.get_paginated_response(rows.serialize(page))
+
+        return Response(rows.serialize(chain.from_iterable(querysets)))
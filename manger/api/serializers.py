@@ -1,24 +1,80 @@
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework import routers, serializers, viewsets
+from rest_framework.decorators import action
 from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
 
-from manger.models import Baby, Journal
+from manger.api.archive import ArchiveListMixin
+from manger.api.cache import VersionedCacheMixin, babies_cache
+from manger.api.fields import ThumbnailsField
+from manger.api.filters import JournalFilterBackend
+from manger.api.pagination import JournalCursorPagination
+from manger.api.rows import RowListMixin
+from manger.api.sparse import SparseFieldsMixin
+from manger.babies import baby_cache
+from manger.db import ReplicaListMixin
+from manger.models import Baby, DailyAttendance, Journal
 
 
 class BabySerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailsField()
+
     class Meta:
         model = Baby
-        fields = ('id', 'name', 'gender', 'birthday', 'photo', 'grade', 'is_study')
+        fields = ('id', 'name', 'gender', 'birthday', 'photo', 'thumbnails', 'grade', 'is_study')
 
 
-class BabyViewSet(viewsets.ModelViewSet):
+class BabyViewSet(VersionedCacheMixin, SparseFieldsMixin, RowListMixin, viewsets.ModelViewSet):
     queryset = Baby.objects.all()
     serializer_class = BabySerializer
+    versioned_cache = babies_cache
+
+    @action(detail=True, methods=['post'])
+    def checkout(self, request, pk=None):
+        record = get_object_or_404(Journal.objects.present().select_related('baby'), baby_id=pk)
+
+        data = {
+            **JournalSerializer.get_instance_data(record),
+            'outcome_time': request.data.get('outcome_time', timezone.now()),
+            'outcome_escort': request.data.get('outcome_escort'),
+        }
+        context = {**self.get_serializer_context(), 'babies': {record.baby_id: record.baby}}
+        serializer = JournalSerializer(record, data=data, context=context)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        return Response(serializer.data)
+
+
+class BabyRelatedField(PrimaryKeyRelatedField):
+    """
+    Если в контексте передан словарь ``babies`` (id -> Baby), ребенок берется
+    из него без запроса к базе — так пакетная запись разрешает всех детей
+    одним запросом. Иначе ребенок берется из кеша процесса ``baby_cache``.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        babies = self.context.get('babies')
+        baby = baby_cache.get(pk) if babies is None else babies.get(pk)
+        if baby is None:
+            self.fail('does_not_exist', pk_value=data)
+        return baby
 
 
 class JournalSerializer(serializers.ModelSerializer):
     DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+    OPEN_VISIT_EXISTS_MESSAGE = 'baby already has an open visit'
 
-    baby = PrimaryKeyRelatedField(queryset=Baby.objects.all())
+    baby = BabyRelatedField(queryset=Baby.objects.all())
 
     def validate(self, attrs):
         if (attrs.get('income_time') is None) ^ (attrs.get('income_escort') is None):
@@ -36,23 +92,99 @@ class JournalSerializer(serializers.ModelSerializer):
 
         return attrs
 
-    def create(self, validated_data):
+    @staticmethod
+    def check_outcome(validated_data):
         if validated_data.get('outcome_time') and validated_data.get('income_time') is None:
             raise serializers.ValidationError('can not create outcome without income')
 
-        return super().create(validated_data)
+    @staticmethod
+    def get_instance_data(instance):
+        return {
+            'baby': instance.baby_id,
+            'income_time': instance.income_time,
+            'income_escort': instance.income_escort,
+            'outcome_time': instance.outcome_time,
+            'outcome_escort': instance.outcome_escort,
+        }
+
+    def get_integrity_error(self, baby, instance=None):
+        """
+        Ошибка валидации вместо ``IntegrityError`` записи или ``None``, если
+        причина другая: ребенка из кеша успели удалить, или у него уже есть
+        открытое посещение.
+        """
+        if not Baby.objects.filter(pk=baby.pk).exists():
+            message = self.fields['baby'].error_messages['does_not_exist'].format(pk_value=baby.pk)
+            return serializers.ValidationError({'baby': [message]})
+
+        present = Journal.objects.present().filter(baby_id=baby.pk)
+        if instance is not None:
+            present = present.exclude(pk=instance.pk)
+        if present.exists():
+            return serializers.ValidationError(self.OPEN_VISIT_EXISTS_MESSAGE)
+        return None
+
+    def create(self, validated_data):
+        self.check_outcome(validated_data)
+
+        try:
+            with transaction.atomic():
+                instance = super().create(validated_data)
+                DailyAttendance.refresh(DailyAttendance.keys_for(instance))
+        except IntegrityError:
+            error = self.get_integrity_error(validated_data['baby'])
+            if error is None:
+                raise
+            raise error
+
+        return instance
 
     def update(self, instance, validated_data):
-        if validated_data.get('outcome_time') and validated_data.get('income_time') is None:
-            raise serializers.ValidationError('can not create outcome without income')
+        self.check_outcome(validated_data)
 
-        return super().update(instance, validated_data)
+        keys = DailyAttendance.keys_for(instance)
+        try:
+            with transaction.atomic():
+                instance = super().update(instance, validated_data)
+                DailyAttendance.refresh(keys | DailyAttendance.keys_for(instance))
+        except IntegrityError:
+            error = self.get_integrity_error(validated_data.get('baby', instance.baby), instance)
+            if error is None:
+                raise
+            raise error
+
+        return instance
 
     class Meta:
         model = Journal
         fields = ('id', 'baby', 'income_time', 'income_escort', 'outcome_time', 'outcome_escort')
 
 
-class JournalViewSet(viewsets.ModelViewSet):
+class DailyAttendanceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyAttendance
+        fields = (
+            'baby', 'date',
+            'first_income_time', 'first_income_escort', 'last_outcome_time', 'last_outcome_escort',
+            'minutes', 'visits',
+        )
+
+
+class JournalViewSet(ReplicaListMixin, SparseFieldsMixin, ArchiveListMixin, RowListMixin, viewsets.ModelViewSet):
     queryset = Journal.objects.all()
     serializer_class = JournalSerializer
+    pagination_class = JournalCursorPagination
+    filter_backends = [JournalFilterBackend]
+
+    def perform_destroy(self, instance):
+        keys = DailyAttendance.keys_for(instance)
+        with transaction.atomic():
+            instance.delete()
+            DailyAttendance.refresh(keys)
+
+    @action(detail=False)
+    def present(self, request):
+        queryset = self.filter_queryset(Journal.objects.present()).order_by('income_time', 'id')
+        serializer = self.get_serializer(queryset, many=True)
+
+        return Response(serializer.data)
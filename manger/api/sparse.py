@@ -0,0 +1,54 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+class SparseFieldsMixin:
+    """
+    Параметр ``?fields=id,name`` оставляет в ответе только перечисленные поля
+    и читает из базы только нужные колонки (``.only()``, а в быстром списке —
+    ``values_list``). Применяется только к чтению: при записи сериализатор
+    должен видеть все поля.
+    """
+    fields_query_param = 'fields'
+
+    def get_sparse_fields(self):
+        if self.request.method not in SAFE_METHODS:
+            return None
+
+        value = self.request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+
+        names = self.get_sparse_fields()
+        if names:
+            self.limit_fields(getattr(serializer, 'child', serializer), names)
+        return serializer
+
+    def limit_fields(self, serializer, names):
+        unknown = set(names) - set(serializer.fields)
+        if unknown:
+            raise serializers.ValidationError({
+                self.fields_query_param: ['Unknown fields: %s' % ', '.join(sorted(unknown))],
+            })
+
+        for name in list(serializer.fields):
+            if name not in names:
+                serializer.fields.pop(name)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        if not self.get_sparse_fields():
+            return queryset
+
+        sources = [
+            field.source for field in self.get_serializer().fields.values()
+            if '.' not in field.source and field.source != '*'
+        ]
+        # пагинатору нужны поля ключа, иначе они дочитывались бы по одному
+        key_fields = getattr(self.paginator, 'key_fields', ())
+        return queryset.only(*sources, *key_fields)
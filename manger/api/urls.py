@@ -2,7 +2,12 @@ from django.urls import include, re_path, path
 from rest_framework import routers
 
 from manger.api.serializers import BabyViewSet, JournalViewSet
-from manger.api.views import BabyStudyList
+from manger.api.views import (
+    AnalyticsView, BabyStudyList, DailyAttendanceList, FeedView, JournalBulkView, JournalExportView,
+    JournalQueueDetailView, JournalQueueView, SyncView,
+)
+from manger.feed import stream_view
+from manger.thumbnails import thumbnail_view
 
 router = routers.DefaultRouter()
 router.register('babies', BabyViewSet)
@@ -10,6 +15,16 @@ router.register('journal', JournalViewSet)
 
 urlpatterns = [
     path('journal/study/', BabyStudyList.as_view(), name='journal-study'),
+    path('journal/bulk/', JournalBulkView.as_view(), name='journal-bulk'),
+    path('journal/queue/', JournalQueueView.as_view(), name='journal-queue'),
+    path('journal/queue/<str:ticket>/', JournalQueueDetailView.as_view(), name='journal-queue-detail'),
+    path('journal/export/', JournalExportView.as_view(), name='journal-export'),
+    path('feed/', FeedView.as_view(), name='feed'),
+    path('feed/stream/', stream_view, name='feed-stream'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('analytics/', AnalyticsView.as_view(), name='analytics'),
+    path('attendance/', DailyAttendanceList.as_view(), name='attendance-list'),
+    path('thumbnails/<int:size>/<path:photo>', thumbnail_view, name='thumbnail'),
     re_path('^', include(router.urls)),
 
 ]
@@ -1,12 +1,367 @@
+from datetime import timedelta
 
-from rest_framework import generics
+from django.db import IntegrityError, transaction
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from rest_framework import generics, serializers, status, views
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from manger.api.serializers import JournalSerializer
-from manger.models import Journal
+from manger import analytics, export, feed, ingest
+from manger.api.archive import ArchiveListMixin
+from manger.api.filters import JournalFilterBackend, get_bool_param, get_date_param, to_int
+from manger.api.pagination import DailyAttendanceCursorPagination, JournalCursorPagination
+from manger.api.rows import RowListMixin, RowSerializer
+from manger.api.sparse import SparseFieldsMixin
+from manger.api.serializers import BabySerializer, DailyAttendanceSerializer, JournalSerializer
+from manger.db import ReplicaListMixin
+from manger.models import Baby, DailyAttendance, Journal, JournalArchive, SyncVersion, Tombstone
 
 
-class BabyStudyList(generics.ListAPIView):
+class BabyStudyList(ReplicaListMixin, SparseFieldsMixin, ArchiveListMixin, RowListMixin, generics.ListAPIView):
     serializer_class = JournalSerializer
+    pagination_class = JournalCursorPagination
+    filter_backends = [JournalFilterBackend]
 
     def get_queryset(self):
         return Journal.objects.filter(baby__is_study=True)
+
+    def get_archive_queryset(self):
+        return JournalArchive.objects.filter(baby__is_study=True)
+
+
+class DailyAttendanceList(ReplicaListMixin, SparseFieldsMixin, RowListMixin, generics.ListAPIView):
+    """
+    Дневные сводки посещений постранично по (дата, ребенок); фильтры
+    ``baby``, ``date_from``, ``date_to``.
+    """
+    serializer_class = DailyAttendanceSerializer
+    pagination_class = DailyAttendanceCursorPagination
+
+    def get_queryset(self):
+        queryset = DailyAttendance.objects.all()
+        params = self.request.query_params
+
+        if 'baby' in params:
+            baby_id = to_int(params['baby'])
+            if baby_id is None:
+                raise serializers.ValidationError({'baby': ['A valid integer is required']})
+            queryset = queryset.filter(baby_id=baby_id)
+
+        date_from, date_to = get_date_param(params, 'date_from'), get_date_param(params, 'date_to')
+        if date_from is not None:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to is not None:
+            queryset = queryset.filter(date__lte=date_to)
+
+        return queryset
+
+
+class JournalExportView(views.APIView):
+    """
+    Потоковая выгрузка журнала в CSV (``?type=csv``) или NDJSON (``?type=ndjson``).
+    Фильтры: ``date_from``, ``date_to`` (по дню прибытия, включительно), ``is_study``;
+    ``archive=true`` добавляет записи из архива.
+    """
+    chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+
+        fmt = params.get('type', 'csv')
+        if fmt not in export.FORMATS:
+            raise serializers.ValidationError({'type': ['Expected one of: %s' % ', '.join(export.FORMATS)]})
+
+        date_from, date_to = get_date_param(params, 'date_from'), get_date_param(params, 'date_to')
+        querysets = export.get_querysets(
+            date_from=DailyAttendance.day_start(date_from) if date_from else None,
+            date_to=DailyAttendance.day_start(date_to + timedelta(days=1)) if date_to else None,
+            is_study=get_bool_param(params, 'is_study'),
+            archive=bool(get_bool_param(params, 'archive')),
+        )
+
+        response = StreamingHttpResponse(
+            export.export(querysets, fmt=fmt, chunk_size=self.chunk_size),
+            content_type=export.CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = 'attachment; filename="journal.%s"' % fmt
+        return response
+
+
+class JournalBulkView(generics.GenericAPIView):
+    """
+    Пакетная отметка прихода/ухода.
+
+    Принимает список записей: элементы без ``id`` создаются, элементы с ``id``
+    обновляют существующую запись (например, проставляют уход). Каждый элемент
+    проходит валидацию ``JournalSerializer``; при ошибке хотя бы в одном
+    ничего не записывается, а в ответе ошибки перечислены по позициям.
+    Ошибкой элемента считается и второе открытое посещение ребенка — с уже
+    открытым в журнале или с другим элементом пакета.
+    """
+    OPEN_VISIT_IN_BATCH_MESSAGE = 'baby has another open visit in the batch'
+
+    serializer_class = JournalSerializer
+    max_items = 1000
+    batch_size = 500
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Expected a list of items']})
+        if len(items) > self.max_items:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ['Ensure this list has no more than %d items' % self.max_items],
+            })
+
+        records = Journal.objects.in_bulk(self.collect_ids(items, 'id'))
+        baby_ids = self.collect_ids(items, 'baby') | {record.baby_id for record in records.values()}
+        context = {**self.get_serializer_context(), 'babies': Baby.objects.in_bulk(baby_ids)}
+
+        errors, to_create, to_update, seen, keys = [], [], [], set(), set()
+        # (позиция, запись после изменений) для проверки открытых посещений
+        visits = []
+        for item in items:
+            if not isinstance(item, dict):
+                errors.append({api_settings.NON_FIELD_ERRORS_KEY: ['Invalid data. Expected a dictionary']})
+                continue
+
+            data, instance = dict(item), None
+            if 'id' in data:
+                pk = to_int(data.pop('id'))
+                instance = records.get(pk)
+                if instance is None:
+                    errors.append({'id': ['Record not found']})
+                    continue
+                if pk in seen:
+                    errors.append({'id': ['Record is duplicated in the batch']})
+                    continue
+                seen.add(pk)
+                data = {**JournalSerializer.get_instance_data(instance), **data}
+
+            serializer = self.get_serializer_class()(instance, data=data, context=context)
+            if not serializer.is_valid():
+                errors.append(serializer.errors)
+                continue
+            try:
+                serializer.check_outcome(serializer.validated_data)
+            except serializers.ValidationError as exc:
+                errors.append({api_settings.NON_FIELD_ERRORS_KEY: exc.detail})
+                continue
+
+            errors.append({})
+            if instance is None:
+                instance = Journal(**serializer.validated_data)
+                to_create.append(instance)
+            else:
+                keys |= DailyAttendance.keys_for(instance)
+                for field, value in serializer.validated_data.items():
+                    setattr(instance, field, value)
+                to_update.append(instance)
+            visits.append((len(errors) - 1, instance))
+
+        self.check_open_visits(visits, errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                # сначала уходы: ребенок может уйти и снова прийти в одном пакете
+                Journal.stamp(to_update + to_create)
+                if to_update:
+                    fields = [field for field in JournalSerializer.Meta.fields if field != 'id'] + ['version']
+                    Journal.objects.bulk_update(to_update, fields, batch_size=self.batch_size)
+                Journal.objects.bulk_create(to_create, batch_size=self.batch_size)
+                DailyAttendance.refresh(keys | DailyAttendance.keys_for(*to_create, *to_update))
+                feed.publish_bulk('journal', created=to_create, updated=to_update)
+        except IntegrityError:
+            # посещение открыли параллельно после проверки
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [JournalSerializer.OPEN_VISIT_EXISTS_MESSAGE],
+            })
+
+        return Response({'created': len(to_create), 'updated': len(to_update)})
+
+    def check_open_visits(self, visits, errors):
+        """
+        Отмечает в ``errors`` элементы, после которых у ребенка осталось бы
+        второе открытое посещение. Открытые посещения из журнала читаются
+        одним запросом; записи, которые пакет изменяет, в расчет не идут —
+        их новое состояние уже в ``visits``.
+        """
+        opened = [
+            (index, record) for index, record in visits
+            if record.income_time is not None and record.outcome_time is None
+        ]
+        if not opened:
+            return
+
+        updated = {record.pk for _, record in visits if record.pk is not None}
+        present = {
+            baby_id for pk, baby_id in Journal.objects.present()
+            .filter(baby_id__in={record.baby_id for _, record in opened}).values_list('id', 'baby_id')
+            if pk not in updated
+        }
+        claimed = set()
+        for index, record in opened:
+            if record.baby_id in present:
+                errors[index] = {api_settings.NON_FIELD_ERRORS_KEY: [JournalSerializer.OPEN_VISIT_EXISTS_MESSAGE]}
+            elif record.baby_id in claimed:
+                errors[index] = {api_settings.NON_FIELD_ERRORS_KEY: [self.OPEN_VISIT_IN_BATCH_MESSAGE]}
+            claimed.add(record.baby_id)
+
+    @staticmethod
+    def collect_ids(items, key):
+        ids = (to_int(item.get(key)) for item in items if isinstance(item, dict))
+        return {pk for pk in ids if pk is not None}
+
+
+class FeedView(views.APIView):
+    """
+    Лента изменений для long-poll: ``?since=<id последнего события>&timeout=<секунды>``.
+
+    Если событий после ``since`` нет, ответ ждет их до ``timeout`` секунд.
+    ``last`` из ответа передается в ``since`` следующего запроса.
+    """
+    max_timeout = 30
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        timeout = to_int(params.get('timeout', 0))
+        if timeout is None or timeout < 0:
+            raise serializers.ValidationError({'timeout': ['A valid non-negative integer is required']})
+
+        events, last = feed.broker.wait(feed.broker.parse_id(params.get('since')), min(timeout, self.max_timeout))
+        return Response({
+            'events': [feed.broker.to_dict(event) for event in events],
+            'last': feed.broker.format_id(last),
+        })
+
+
+class SyncView(views.APIView):
+    """
+    Изменения детей и журнала после версии ``since`` (``0`` — все данные).
+
+    В ответе не больше ``limit`` изменений по возрастанию версии: измененные
+    записи, id удаленных в ``deleted`` и ``version`` для следующего запроса;
+    ``more`` — изменения еще остались. ``reset`` означает, что надгробия
+    после ``since`` уже удалены и локальную копию нужно загрузить заново.
+    """
+    max_limit = 1000
+    sources = (
+        ('babies', Baby, BabySerializer),
+        ('journal', Journal, JournalSerializer),
+    )
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        since = to_int(params.get('since', 0))
+        if since is None or since < 0:
+            raise serializers.ValidationError({'since': ['A valid non-negative integer is required']})
+        limit = to_int(params.get('limit', self.max_limit))
+        if limit is None or limit < 1:
+            raise serializers.ValidationError({'limit': ['A valid positive integer is required']})
+        limit = min(limit, self.max_limit)
+
+        pruned = SyncVersion.objects.filter(pk=1).values_list('pruned', flat=True).first() or 0
+        if since and since < pruned:
+            return Response({'reset': True, 'version': 0, 'more': True})
+
+        # из каждого источника не больше limit + 1 изменений, затем общий срез по версии
+        changes, row_serializers = [], {}
+        for name, model, serializer_class in self.sources:
+            rows = row_serializers[name] = RowSerializer(serializer_class())
+            queryset = rows.get_queryset(model.objects.filter(version__gt=since).order_by('version'), extra=('version',))
+            changes.extend((row.version, name, row) for row in queryset[:limit + 1])
+        if since:
+            tombstones = Tombstone.objects.filter(version__gt=since).order_by('version')
+            changes.extend(
+                (version, None, (model, object_id))
+                for model, object_id, version in tombstones.values_list('model', 'object_id', 'version')[:limit + 1]
+            )
+        changes.sort(key=lambda change: change[0])
+        page = changes[:limit]
+
+        data = {
+            'reset': False,
+            'version': page[-1][0] if page else since,
+            'more': len(changes) > limit,
+            'deleted': {model._meta.model_name: [] for _, model, _ in self.sources},
+        }
+        for name, rows in row_serializers.items():
+            data[name] = rows.serialize(row for _, source, row in page if source == name)
+        for _, source, row in page:
+            if source is None:
+                model, object_id = row
+                data['deleted'][model].append(object_id)
+        return Response(data)
+
+
+class JournalQueueView(generics.GenericAPIView):
+    """
+    Отложенная запись в журнал: запись проверяется ``JournalSerializer`` и
+    сохраняется в очередь на диске, ответ ``202`` содержит билет. Элемент
+    с ``id`` обновляет существующую запись: в очередь попадают только
+    переданные поля, остальные берутся из записи при применении. Результат —
+    по адресу из ``Location`` (``journal-queue-detail``).
+    """
+    serializer_class = JournalSerializer
+
+    def post(self, request, *args, **kwargs):
+        data, instance, fields = request.data, None, None
+        if isinstance(data, dict) and 'id' in data:
+            data = dict(data)
+            instance = generics.get_object_or_404(Journal.objects.all(), pk=to_int(data.pop('id')))
+            fields = set(data) & set(ingest.FIELDS)
+            data = {**JournalSerializer.get_instance_data(instance), **data}
+
+        serializer = self.get_serializer(instance, data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.check_outcome(serializer.validated_data)
+
+        ticket = ingest.get_queue().put(ingest.to_payload(serializer, fields))
+        return Response(
+            {'ticket': ticket, 'status': ingest.PENDING},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('journal-queue-detail', args=[ticket])},
+        )
+
+
+class JournalQueueDetailView(views.APIView):
+    """
+    Состояние отложенной записи: ``pending``, ``done`` (с записью журнала)
+    или ``failed`` (с ошибками проверки при применении).
+    """
+
+    def get(self, request, ticket, *args, **kwargs):
+        state = ingest.get_queue().get(ticket)
+        if state is None:
+            raise Http404
+
+        status_name, journal_id, errors = state
+        data = {'ticket': ticket, 'status': status_name}
+        if status_name == ingest.DONE:
+            record = Journal.objects.filter(pk=journal_id).first()
+            data['record'] = JournalSerializer(record).data if record is not None else None
+        elif status_name == ingest.FAILED:
+            data['errors'] = errors
+        return Response(data)
+
+
+class AnalyticsView(views.APIView):
+    """
+    Аналитика за ``date_from``..``date_to`` (включительно): заполненность по
+    15-минутным слотам (средняя по дням посещений и максимум), средняя
+    длительность посещения по классам и прибытия по сопровождающим.
+    """
+    max_days = 731
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        date_from, date_to = get_date_param(params, 'date_from'), get_date_param(params, 'date_to')
+        if date_from is None or date_to is None:
+            raise serializers.ValidationError({'date_from': ['"date_from" and "date_to" are required']})
+        if date_to < date_from or (date_to - date_from).days >= self.max_days:
+            raise serializers.ValidationError({'date_to': ['Expected a range of 1 to %d days' % self.max_days]})
+
+        return Response(analytics.get(date_from, date_to))
@@ -1,5 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class MangerConfig(AppConfig):
     name = 'manger'
+
+    def ready(self):
+        from manger import babies, db, feed, sync
+        from manger.api.cache import babies_cache
+        from manger.models import Baby, Journal
+
+        connection_created.connect(db.configure_connection, dispatch_uid='manger-configure-connection')
+
+        for model in (Baby, Journal):
+            post_save.connect(feed.on_save, sender=model, dispatch_uid='feed-save-%s' % model._meta.model_name)
+            post_delete.connect(feed.on_delete, sender=model, dispatch_uid='feed-delete-%s' % model._meta.model_name)
+            post_delete.connect(sync.on_delete, sender=model, dispatch_uid='sync-delete-%s' % model._meta.model_name)
+
+        post_save.connect(babies.on_change, sender=Baby, dispatch_uid='babies-save')
+        post_delete.connect(babies.on_change, sender=Baby, dispatch_uid='babies-delete')
+        post_save.connect(babies_cache.on_change, sender=Baby, dispatch_uid='babies-cache-save')
+        post_delete.connect(babies_cache.on_change, sender=Baby, dispatch_uid='babies-cache-delete')
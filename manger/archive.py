@@ -0,0 +1,66 @@
+"""
+Перенос закрытых посещений из журнала в ``JournalArchive``.
+
+Перенос идет пачками по возрастанию id, каждая пачка — отдельная
+транзакция: строки пачки блокируются, копируются ``INSERT ... SELECT``, а
+из журнала удаляются только id, уже записанные в архив. Прерванный перенос
+безопасно продолжить повторным запуском.
+Удаление идет мимо сигналов моделей: перенос в архив не изменение данных,
+ленте и синхронизации о нем знать не нужно.
+"""
+from django.db import connection, transaction
+
+from manger.models import Journal, JournalArchive
+
+COLUMNS = ('id', 'baby', 'income_time', 'income_escort', 'outcome_time', 'outcome_escort')
+
+
+def move_batch(cutoff, after_id, batch_size):
+    """
+    Переносит до ``batch_size`` посещений, закрытых раньше ``cutoff``, с id
+    больше ``after_id``. Возвращает ``(число, последний id)``.
+    """
+    quote = connection.ops.quote_name
+    id_column = quote(Journal._meta.get_field('id').column)
+    columns = ', '.join(quote(Journal._meta.get_field(name).column) for name in COLUMNS)
+    archive_columns = ', '.join(quote(JournalArchive._meta.get_field(name).column) for name in COLUMNS)
+
+    with transaction.atomic():
+        # блокировка пачки: до коммита посещение не изменят между копированием и удалением
+        ids = list(
+            Journal.objects.select_for_update().filter(id__gt=after_id, outcome_time__lt=cutoff)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0, after_id
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO %s (%s) SELECT %s FROM %s WHERE %s BETWEEN %%s AND %%s AND %s < %%s' % (
+                    quote(JournalArchive._meta.db_table), archive_columns, columns, quote(Journal._meta.db_table),
+                    id_column, quote(Journal._meta.get_field('outcome_time').column),
+                ),
+                [ids[0], ids[-1], Journal._meta.get_field('outcome_time').get_db_prep_value(cutoff, connection)],
+            )
+            # удаляется только то, что уже лежит в архиве: условие по outcome_time
+            # не проверяется второй раз и не может разойтись с INSERT
+            cursor.execute(
+                'DELETE FROM %s WHERE %s IN (SELECT %s FROM %s WHERE %s BETWEEN %%s AND %%s)' % (
+                    quote(Journal._meta.db_table), id_column, quote(JournalArchive._meta.get_field('id').column),
+                    quote(JournalArchive._meta.db_table), quote(JournalArchive._meta.get_field('id').column),
+                ),
+                [ids[0], ids[-1]],
+            )
+    return len(ids), ids[-1]
+
+
+def archive(cutoff, batch_size=5000):
+    """
+    Генератор числа перенесенных посещений после каждой пачки.
+    """
+    after_id = 0
+    while True:
+        count, after_id = move_batch(cutoff, after_id, batch_size)
+        if not count:
+            return
+        yield count
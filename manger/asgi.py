@@ -0,0 +1,208 @@
+"""
+ASGI-приложение API.
+
+Долгие соединения ленты обслуживаются в цикле событий и не занимают
+потоков: поток ``feed/stream/`` целиком асинхронный, а long-poll ``feed/``
+сначала ждет событий в цикле и только потом отдается обычному view, уже без
+ожидания. Остальные запросы проходят через обычный стек Django (middleware,
+DRF, рендереры) в пуле из ``MANGER_ASGI_THREADS`` потоков: тело запроса
+читается и ответ отправляется в цикле событий, поэтому медленный клиент
+занимает поток только на время работы view. Исключение — потоковые ответы
+(выгрузка журнала): их курсор привязан к соединению с базой своего потока,
+и они отправляются из того же потока.
+"""
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qsl, urlencode
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls import reverse
+
+from manger import feed
+from manger.api.filters import to_int
+from manger.api.views import FeedView
+
+
+def build_environ(scope, body):
+    """
+    WSGI environ (PEP 3333) для HTTP-запроса ASGI.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        environ[name] = '%s,%s' % (environ[name], value) if name in environ else value
+    # тело уже прочитано целиком: длина берется из него, а не из заголовка,
+    # которого у запроса частями может и не быть
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def get_header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin1')
+    return None
+
+
+class ASGIHandler:
+    def __init__(self, threads=None):
+        self.wsgi = WSGIHandler()
+        self.pool = ThreadPoolExecutor(threads or settings.MANGER_ASGI_THREADS, thread_name_prefix='manger-asgi')
+        self.feed_path = reverse('feed')
+        self.stream_path = reverse('feed-stream')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type: %s' % scope['type'])
+
+        body = await self.read_body(receive)
+        if body is None:
+            return
+
+        if scope['method'] == 'GET' and scope['path'] == self.stream_path:
+            await self.stream(scope, receive, send)
+            return
+        if scope['method'] == 'GET' and scope['path'] == self.feed_path:
+            scope = await self.wait_feed(scope)
+        await self.call_django(scope, body, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        """
+        Тело запроса целиком; ``None``, если клиент отключился раньше.
+        """
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def wait_feed(self, scope):
+        """
+        Ждет событий long-poll в цикле событий и возвращает scope, в котором
+        ``since`` указывает на то же место ленты, а ``timeout`` равен нулю.
+        Неверные параметры view проверит сам.
+        """
+        params = dict(parse_qsl(scope.get('query_string', b'').decode('latin1')))
+        timeout = to_int(params.get('timeout', 0))
+        if timeout is None or timeout <= 0:
+            return scope
+
+        seq = feed.broker.parse_id(params.get('since'))
+        if seq < 0:
+            return scope
+
+        await feed.broker.wait_async(seq, min(timeout, FeedView.max_timeout))
+
+        params.update(since=feed.broker.format_id(seq), timeout=0)
+        return {**scope, 'query_string': urlencode(params).encode('latin1')}
+
+    async def stream(self, scope, receive, send):
+        params = dict(parse_qsl(scope.get('query_string', b'').decode('latin1')))
+        seq = feed.broker.parse_id(get_header(scope, b'last-event-id') or params.get('since'))
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in feed.STREAM_HEADERS],
+        })
+        # после тела запроса receive вернет только http.disconnect
+        disconnected = asyncio.ensure_future(receive())
+        chunks = feed.aiter_stream(seq)
+        try:
+            while True:
+                chunk = asyncio.ensure_future(chunks.__anext__())
+                await asyncio.wait((chunk, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    chunk.cancel()
+                    await asyncio.wait((chunk,))
+                    return
+                try:
+                    body = chunk.result().encode()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            await chunks.aclose()
+
+    async def call_django(self, scope, body, send):
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self.pool, self.run_wsgi, build_environ(scope, body), send, loop)
+        if response is not None:
+            start, content = response
+            await send(start)
+            await send({'type': 'http.response.body', 'body': content})
+
+    def run_wsgi(self, environ, send, loop):
+        """
+        Выполняется в потоке пула. Обычный ответ возвращается в цикл событий
+        целиком, потоковый отправляется отсюда по частям.
+        """
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start.update(
+                type='http.response.start',
+                status=int(status.split(' ', 1)[0]),
+                headers=[(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+            )
+
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = self.wsgi(environ, start_response)
+        try:
+            if not getattr(response, 'streaming', False):
+                return start, b''.join(response)
+
+            send_sync(start)
+            for chunk in response:
+                if chunk:
+                    send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_sync({'type': 'http.response.body', 'body': b''})
+            return None
+        finally:
+            # request_finished: соединения с базой этого потока закрываются по CONN_MAX_AGE
+            response.close()
@@ -0,0 +1,56 @@
+"""
+Кеш детей в памяти процесса.
+
+Детей немного (тысячи), а каждая запись журнала проверяет, что ребенок
+существует, поэтому вся таблица читается одним запросом и держится в памяти
+``MANGER_BABY_CACHE_TTL`` секунд. Сохранение или удаление ребенка в этом
+процессе сбрасывает кеш сразу и еще раз после коммита; изменения из других
+процессов видны не позже чем через TTL. Ребенок, которого нет в кеше,
+ищется в базе.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from manger.models import Baby
+
+
+class BabyCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = [field.attname for field in Baby._meta.concrete_fields]
+        self.rows = None
+        self.expires = 0
+
+    def load(self):
+        with self.lock:
+            if self.rows is None or time.monotonic() >= self.expires:
+                # TTL отсчитывается от начала чтения: запись во время чтения не продлевает старые данные
+                expires = time.monotonic() + settings.MANGER_BABY_CACHE_TTL
+                self.rows = {row[0]: row for row in Baby.objects.using('default').values_list(*self.names)}
+                self.expires = expires
+            return self.rows
+
+    def get(self, pk):
+        """
+        Ребенок по id (новый экземпляр модели на каждый вызов) или ``None``.
+        """
+        row = self.load().get(pk)
+        if row is None:
+            return Baby.objects.filter(pk=pk).first()
+        return Baby.from_db('default', self.names, row)
+
+    def clear(self):
+        with self.lock:
+            self.rows = None
+
+
+baby_cache = BabyCache()
+
+
+def on_change(sender, instance, **kwargs):
+    baby_cache.clear()
+    # чтение между сбросом и коммитом могло закешировать старые данные
+    transaction.on_commit(baby_cache.clear)
@@ -0,0 +1,342 @@
+"""
+Нагрузочный прогон API: синтетические данные, маршруты и лимиты запросов.
+
+``ROUTES`` описывает каждый маршрут ``manger/api/urls.py`` вместе с
+максимальным числом SQL-запросов на один вызов. Этот же список проверяется
+в тестах на маленьких данных, чтобы N+1 ловился в CI. Без маршрутов
+остаются поток событий и миниатюры: они не обращаются к базе, а фотографий
+в синтетических данных нет. Отложенные записи применяются из очереди при
+построении запроса ``journal-queue-detail``, поэтому прогон идет с отдельной
+``MANGER_INGEST_QUEUE`` и без потока-писателя. ``measure_formats``
+сравнивает размер ответа и время кодирования в ``FORMATS``, а
+``wsgi_concurrency``/``asgi_concurrency`` — задержку обычных запросов, пока
+открыто много ждущих long-poll соединений.
+"""
+import asyncio
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from manger import feed, ingest
+from manger.api import compression
+from manger.asgi import ASGIHandler, build_environ
+from manger.api.renderers import JSONRenderer, MessagePackRenderer
+from manger.models import Baby, Journal
+
+Route = namedtuple('Route', 'name method max_queries build')
+Result = namedtuple('Result', 'name requests seconds p50 p99 max_queries queries errors')
+FormatResult = namedtuple('FormatResult', 'route name size gzip brotli seconds')
+ConcurrencyResult = namedtuple('ConcurrencyResult', 'mode connections threads requests p50 p99 errors')
+
+
+class Dataset:
+    """
+    Идентификаторы засеянных данных, из которых маршруты строят запросы.
+    """
+
+    def __init__(self):
+        self.baby_ids = list(Baby.objects.order_by('id').values_list('id', flat=True))
+        records = list(Journal.objects.order_by('-id').values_list('id', 'baby_id')[:1000])
+        self.record_ids = [pk for pk, _ in records]
+        self.record_babies = dict(records)
+        self.open_baby_ids = list(Journal.objects.present().order_by('baby_id').values_list('baby_id', flat=True))
+        self.last_day = timezone.localtime(
+            Journal.objects.order_by('-income_time').values_list('income_time', flat=True).first() or timezone.now()
+        ).date()
+
+    def baby(self, i):
+        return self.baby_ids[i % len(self.baby_ids)]
+
+    def record(self, i):
+        return self.record_ids[i % len(self.record_ids)]
+
+    def visit(self, baby_id, i):
+        # закрытое посещение в будущем, чтобы не пересекаться с открытыми
+        income_time = datetime.combine(self.last_day + timedelta(days=1 + i // len(self.baby_ids)), datetime.min.time())
+        income_time = timezone.make_aware(income_time) + timedelta(hours=8)
+        return {
+            'baby': baby_id,
+            'income_time': income_time.isoformat(),
+            'income_escort': Journal.ESCORT_FATHER,
+            'outcome_time': (income_time + timedelta(hours=8)).isoformat(),
+            'outcome_escort': Journal.ESCORT_MOTHER,
+        }
+
+    def new_baby(self, i):
+        """
+        Отдельный ребенок для удаления: засеянные данные не убывают.
+        """
+        return Baby.objects.create(**baby_payload(i)).pk
+
+    def new_record(self, i):
+        baby_id = self.baby(i)
+        visit = {**self.visit(baby_id, i), 'baby_id': baby_id}
+        del visit['baby']
+        return Journal.objects.create(**visit).pk
+
+    def ticket(self, i):
+        """
+        Билет отложенной записи, уже примененной к журналу.
+        """
+        queue = ingest.get_queue()
+        ticket = queue.put(self.visit(self.baby(i), i))
+        ingest.drain(queue, batch_size=500)
+        return ticket
+
+    def week(self):
+        return {'date_from': str(self.last_day - timedelta(days=6)), 'date_to': str(self.last_day)}
+
+
+def baby_payload(i):
+    return {'name': 'Ребенок %d' % i, 'gender': i % 2, 'birthday': '2015-01-01', 'grade': i % 11}
+
+
+ROUTES = (
+    Route('baby-list', 'get', 1, lambda data, i: (reverse('baby-list'), None)),
+    Route('baby-detail', 'get', 1, lambda data, i: (reverse('baby-detail', args=[data.baby(i)]), None)),
+    Route('baby-create', 'post', 3, lambda data, i: (reverse('baby-list'), baby_payload(i))),
+    Route('baby-update', 'put', 4, lambda data, i: (reverse('baby-detail', args=[data.baby(i)]), baby_payload(i))),
+    Route('baby-delete', 'delete', 8, lambda data, i: (reverse('baby-detail', args=[data.new_baby(i)]), None)),
+    Route('baby-checkout', 'post', 10, lambda data, i: (
+        reverse('baby-checkout', args=[data.open_baby_ids[i % len(data.open_baby_ids)]]),
+        {'outcome_escort': Journal.ESCORT_MOTHER},
+    )),
+    Route('journal-list', 'get', 2, lambda data, i: (reverse('journal-list'), {'page_size': 100})),
+    Route('journal-list-week', 'get', 2, lambda data, i: (
+        reverse('journal-list'), {'baby': data.baby(i), 'page_size': 100, **data.week()},
+    )),
+    Route('journal-list-archive', 'get', 4, lambda data, i: (
+        reverse('journal-list'), {'baby': data.baby(i), 'page_size': 100, 'archive': 'true'},
+    )),
+    Route('journal-detail', 'get', 1, lambda data, i: (reverse('journal-detail', args=[data.record(i)]), None)),
+    Route('journal-create', 'post', 10, lambda data, i: (reverse('journal-list'), data.visit(data.baby(i), i))),
+    Route('journal-update', 'put', 10, lambda data, i: (
+        reverse('journal-detail', args=[data.record(i)]), data.visit(data.record_babies[data.record(i)], i),
+    )),
+    Route('journal-patch', 'patch', 10, lambda data, i: (
+        reverse('journal-detail', args=[data.record(i)]),
+        {name: value for name, value in data.visit(data.record_babies[data.record(i)], i).items() if name != 'baby'},
+    )),
+    Route('journal-delete', 'delete', 11, lambda data, i: (reverse('journal-detail', args=[data.new_record(i)]), None)),
+    Route('journal-study', 'get', 2, lambda data, i: (reverse('journal-study'), {'page_size': 100})),
+    Route('journal-present', 'get', 1, lambda data, i: (reverse('journal-present'), None)),
+    Route('journal-bulk', 'post', 11, lambda data, i: (
+        reverse('journal-bulk'), [data.visit(data.baby(i * 100 + j), i * 100 + j) for j in range(100)],
+    )),
+    Route('journal-queue', 'post', 1, lambda data, i: (reverse('journal-queue'), data.visit(data.baby(i), i))),
+    Route('journal-queue-detail', 'get', 1, lambda data, i: (reverse('journal-queue-detail', args=[data.ticket(i)]), None)),
+    Route('journal-export', 'get', 1, lambda data, i: (
+        reverse('journal-export'), {'date_from': str(data.last_day), 'date_to': str(data.last_day)},
+    )),
+    Route('analytics', 'get', 2, lambda data, i: (
+        reverse('analytics'), {'date_from': str(data.last_day - timedelta(days=364)), 'date_to': str(data.last_day)},
+    )),
+    Route('attendance-list', 'get', 1, lambda data, i: (reverse('attendance-list'), data.week())),
+    Route('feed', 'get', 0, lambda data, i: (reverse('feed'), {'since': feed.broker.format_id(0), 'timeout': 0})),
+    Route('sync', 'get', 4, lambda data, i: (reverse('sync'), {'since': 1, 'limit': 100})),
+)
+
+FORMATS = (
+    ('json', JSONRenderer, 'application/json'),
+    ('json-columns', JSONRenderer, 'application/json; layout=columns'),
+    ('msgpack', MessagePackRenderer, 'application/msgpack'),
+    ('msgpack-columns', MessagePackRenderer, 'application/msgpack; layout=columns'),
+)
+
+
+def seed(babies, journal, batch_size=10000, today=None):
+    """
+    Засевает ``babies`` детей и около ``journal`` записей журнала: у каждого
+    ребенка по посещению в день назад от ``today``, последнее — открытое.
+    """
+    today = today or date.today()
+    days = max(journal // babies, 1)
+
+    with transaction.atomic():
+        created = [
+            Baby(
+                name='Ребенок %d' % i, gender=i % 2, birthday=date(2015, 1, 1) + timedelta(days=i % 1000),
+                grade=i % 11, is_study=i % 3 == 0,
+            )
+            for i in range(babies)
+        ]
+        Baby.stamp(created)
+        Baby.objects.bulk_create(created, batch_size=batch_size)
+        baby_ids = list(Baby.objects.order_by('id').values_list('id', flat=True))
+
+        batch = []
+        for day in range(days - 1, -1, -1):
+            start = timezone.make_aware(datetime.combine(today - timedelta(days=day), datetime.min.time()))
+            for n, baby_id in enumerate(baby_ids):
+                income_time = start + timedelta(hours=8, minutes=n % 60)
+                batch.append(Journal(
+                    baby_id=baby_id,
+                    income_time=income_time, income_escort=n % 2,
+                    outcome_time=income_time + timedelta(hours=8) if day else None,
+                    outcome_escort=(n + 1) % 2 if day else None,
+                ))
+                if len(batch) >= batch_size:
+                    Journal.stamp(batch)
+                    Journal.objects.bulk_create(batch)
+                    batch = []
+        Journal.stamp(batch)
+        Journal.objects.bulk_create(batch)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def run_route(client, route, data, requests):
+    timings, max_queries, errors = [], 0, 0
+
+    for i in range(requests):
+        url, payload = route.build(data, i)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if route.method == 'get':
+                response = client.get(url, payload)
+            else:
+                response = getattr(client, route.method)(url, payload, format='json')
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            timings.append(time.perf_counter() - start)
+
+        max_queries = max(max_queries, len(queries))
+        if response.status_code >= 400:
+            errors += 1
+
+    return Result(
+        route.name, requests, sum(timings), percentile(timings, 0.5), percentile(timings, 0.99),
+        route.max_queries, max_queries, errors,
+    )
+
+
+def measure_formats(client, route, data, repeats):
+    """
+    Кодирует данные одного ответа маршрута во всех ``FORMATS``; время — среднее
+    на кодирование, размеры — без сжатия и после gzip и brotli (``None``, если
+    brotli не установлен). Для потоковых и неуспешных ответов — пустой список.
+    """
+    url, payload = route.build(data, 0)
+    response = client.get(url, payload)
+    if response.streaming or response.status_code != 200:
+        return []
+
+    results = []
+    for name, renderer_class, media_type in FORMATS:
+        renderer = renderer_class()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            content = renderer.render(response.data, media_type, {})
+        seconds = (time.perf_counter() - start) / repeats
+
+        results.append(FormatResult(
+            route.name, name, len(content), len(compression.compress(content, 'gzip')),
+            None if compression.brotli is None else len(compression.compress(content, 'br')), seconds,
+        ))
+    return results
+
+
+def make_scope(path, query='', method='GET', headers=()):
+    """
+    HTTP scope ASGI для запроса без сервера.
+    """
+    return {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+        'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+        'headers': [(name.encode(), value.encode()) for name, value in headers],
+    }
+
+
+def call_wsgi(handler, path, query=''):
+    status = []
+    response = handler(build_environ(make_scope(path, query), b''), lambda value, headers: status.append(value))
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return int(status[0].split(' ', 1)[0])
+
+
+async def call_asgi(app, path, query=''):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(make_scope(path, query), receive, send)
+    return messages[0]['status']
+
+
+def concurrency_result(mode, connections, threads, latencies, statuses):
+    return ConcurrencyResult(
+        mode, connections, threads, len(latencies), percentile(latencies, 0.5), percentile(latencies, 0.99),
+        sum(status >= 400 for status in statuses),
+    )
+
+
+def wsgi_concurrency(connections, requests, threads, hold):
+    """
+    Многопоточный WSGI-сервер с ``threads`` потоками: ``connections`` long-poll
+    запросов ленты по ``hold`` секунд, затем одновременно ``requests``
+    запросов списка детей. Задержка считается от постановки запроса в очередь
+    сервера.
+    """
+    handler = WSGIHandler()
+    feed_path, baby_path = reverse('feed'), reverse('baby-list')
+
+    def timed(queued):
+        status = call_wsgi(handler, baby_path)
+        return time.perf_counter() - queued, status
+
+    with ThreadPoolExecutor(threads) as pool:
+        idle = [pool.submit(call_wsgi, handler, feed_path, 'timeout=%d' % hold) for _ in range(connections)]
+        results = [pool.submit(timed, time.perf_counter()) for _ in range(requests)]
+        results = [future.result() for future in results]
+        statuses = [future.result() for future in idle]
+
+    return concurrency_result(
+        'wsgi', connections, threads, [latency for latency, _ in results], statuses + [status for _, status in results],
+    )
+
+
+def asgi_concurrency(connections, requests, threads, hold):
+    """
+    То же для ``ASGIHandler`` с пулом из ``threads`` потоков.
+    """
+    app = ASGIHandler(threads)
+    feed_path, baby_path = reverse('feed'), reverse('baby-list')
+
+    async def timed():
+        start = time.perf_counter()
+        status = await call_asgi(app, baby_path)
+        return time.perf_counter() - start, status
+
+    async def run():
+        idle = [asyncio.ensure_future(call_asgi(app, feed_path, 'timeout=%d' % hold)) for _ in range(connections)]
+        # long-poll запросы должны начать ждать раньше обычных
+        await asyncio.sleep(0.1)
+        results = await asyncio.gather(*(timed() for _ in range(requests)))
+        return results, await asyncio.gather(*idle)
+
+    try:
+        results, statuses = asyncio.run(run())
+    finally:
+        app.pool.shutdown()
+
+    return concurrency_result(
+        'asgi', connections, threads, [latency for latency, _ in results], statuses + [status for _, status in results],
+    )
@@ -0,0 +1,69 @@
+"""
+Настройка соединений с базой и чтение списков с реплики.
+
+Для SQLite при открытии соединения применяются ``MANGER_SQLITE_PRAGMAS``:
+WAL, чтобы читатели не ждали писателя, и размеры кеша страниц и mmap.
+``ReplicaRouter`` отправляет чтения внутри ``replica_reads()`` на алиас
+``MANGER_DB_REPLICA``; запись и все остальные чтения идут в ``default``.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_replica_reads = ContextVar('manger_replica_reads', default=False)
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+
+    read_only = 'mode=ro' in connection.settings_dict['NAME']
+    with connection.cursor() as cursor:
+        for name, value in settings.MANGER_SQLITE_PRAGMAS:
+            # режим журнала меняется только соединением с правом записи
+            if read_only and name == 'journal_mode':
+                continue
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return settings.MANGER_DB_REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # реплика получает схему от основной базы
+        if db == settings.MANGER_DB_REPLICA:
+            return False
+        return None
+
+
+class ReplicaListMixin:
+    """
+    ``list`` читает с реплики, если она настроена. Только для списков,
+    которым допустимо отставание реплики на время репликации.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if settings.MANGER_DB_REPLICA is None:
+            return super().list(request, *args, **kwargs)
+
+        with replica_reads():
+            return super().list(request, *args, **kwargs)
@@ -0,0 +1,114 @@
+import csv
+import json
+from heapq import merge
+from io import StringIO
+from itertools import chain
+from operator import itemgetter
+
+from manger.models import Journal, JournalArchive
+
+FIELDS = ('id', 'baby', 'income_time', 'income_escort', 'outcome_time', 'outcome_escort')
+COLUMNS = ('id', 'baby_id', 'income_time', 'income_escort', 'outcome_time', 'outcome_escort')
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def format_datetime(value):
+    # тот же формат, что у DateTimeField в DRF
+    if value is None:
+        return None
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def get_querysets(date_from=None, date_to=None, is_study=None, archive=False):
+    """
+    Записи журнала (и архива при ``archive``) для выгрузки; границы
+    ``date_from``/``date_to`` — datetime по ``income_time``, ``date_to`` не включается.
+    """
+    querysets = []
+    for model in (Journal, JournalArchive) if archive else (Journal,):
+        queryset = model.objects.all()
+        if date_from is not None:
+            queryset = queryset.filter(income_time__gte=date_from)
+        if date_to is not None:
+            queryset = queryset.filter(income_time__lt=date_to)
+        if is_study is not None:
+            queryset = queryset.filter(baby__is_study=is_study)
+        querysets.append(queryset.values_list(*COLUMNS))
+    return querysets
+
+
+def iter_rows(querysets, chunk_size=2000):
+    """
+    Строки по (income_time, id). Несколько источников (журнал и архив)
+    сливаются без сортировки в памяти; для этого записи без income_time
+    читаются отдельным сегментом первыми, как в пагинации.
+    """
+    if len(querysets) == 1:
+        rows = querysets[0].order_by('income_time', 'id').iterator(chunk_size=chunk_size)
+    else:
+        rows = chain(*merge_segments(querysets, chunk_size))
+
+    for pk, baby_id, income_time, income_escort, outcome_time, outcome_escort in rows:
+        yield pk, baby_id, format_datetime(income_time), income_escort, format_datetime(outcome_time), outcome_escort
+
+
+def merge_segments(querysets, chunk_size):
+    empty = merge(
+        *(queryset.filter(income_time__isnull=True).order_by('id').iterator(chunk_size=chunk_size)
+          for queryset in querysets),
+        key=itemgetter(0),
+    )
+    filled = merge(
+        *(queryset.filter(income_time__isnull=False).order_by('income_time', 'id').iterator(chunk_size=chunk_size)
+          for queryset in querysets),
+        key=itemgetter(2, 0),
+    )
+    return empty, filled
+
+
+def iter_csv(rows, chunk_size=2000):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows, chunk_size=2000):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export(querysets, fmt='csv', chunk_size=2000):
+    """
+    Генератор кусков выгрузки в формате ``csv`` или ``ndjson``.
+    Данные читаются порциями по ``chunk_size`` строк, память не растет с размером журнала.
+    """
+    rows = iter_rows(querysets, chunk_size=chunk_size)
+    if fmt == 'ndjson':
+        return iter_ndjson(rows, chunk_size=chunk_size)
+    return iter_csv(rows, chunk_size=chunk_size)
@@ -0,0 +1,224 @@
+"""
+Лента изменений детей и журнала.
+
+События создаются обработчиками ``post_save``/``post_delete`` после коммита
+и складываются в брокер процесса: кольцевой буфер с монотонным номером.
+Все подключенные экраны читают один буфер, не обращаясь к базе. Номер
+события — ``эпоха:номер``; эпоха меняется при перезапуске процесса, и
+клиент с чужой эпохой или слишком старым номером получает событие
+``reset`` — сигнал перечитать данные целиком. Ждать событий можно и в
+потоке (``wait``), и в цикле событий asyncio (``wait_async``).
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import StreamingHttpResponse
+
+Event = namedtuple('Event', 'seq type model id data')
+
+CREATED, UPDATED, DELETED, RESET = 'created', 'updated', 'deleted', 'reset'
+
+
+class Broker:
+    def __init__(self, size=10000):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.events = deque(maxlen=size)
+        self.condition = threading.Condition()
+        # функции, будящие ожидающих в циклах событий
+        self.waiters = set()
+
+    def publish(self, type, model, pk=None, data=None):
+        with self.condition:
+            self.seq += 1
+            self.events.append(Event(self.seq, type, model, pk, data))
+            self.condition.notify_all()
+            for wake in self.waiters:
+                wake()
+
+    def format_id(self, seq):
+        return '%s:%d' % (self.epoch, seq)
+
+    def parse_id(self, value):
+        """
+        Номер последнего полученного клиентом события. Без ``value`` лента
+        начинается с текущего момента; ``-1`` — клиент из другой эпохи.
+        """
+        if not value:
+            return self.seq
+
+        epoch, _, seq = value.partition(':')
+        try:
+            seq = int(seq)
+        except ValueError:
+            return -1
+        if epoch != self.epoch or seq > self.seq:
+            return -1
+        return seq
+
+    def since(self, seq):
+        """
+        ``(события после seq, номер последнего события)``; если часть событий
+        уже вытеснена из буфера, вместо них возвращается одно событие ``reset``.
+        """
+        with self.condition:
+            first = self.events[0].seq if self.events else self.seq + 1
+            if seq < 0 or seq < first - 1:
+                return [Event(self.seq, RESET, None, None, None)], self.seq
+            return [event for event in self.events if event.seq > seq], self.seq
+
+    def wait(self, seq, timeout):
+        """
+        Как ``since``, но если новых событий нет, ждет их до ``timeout`` секунд.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq != seq, timeout)
+            return self.since(seq)
+
+    async def wait_async(self, seq, timeout):
+        """
+        Как ``wait``, но ждет в цикле событий, не занимая поток.
+        """
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(ready.set)
+
+        with self.condition:
+            if self.seq != seq:
+                return self.since(seq)
+            self.waiters.add(wake)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.condition:
+                self.waiters.discard(wake)
+        return self.since(seq)
+
+    def to_dict(self, event):
+        return {
+            'id': self.format_id(event.seq),
+            'type': event.type,
+            'model': event.model,
+            'pk': event.id,
+            'data': event.data,
+        }
+
+
+broker = Broker()
+
+
+def publish_on_commit(type, model=None, pk=None, data=None):
+    transaction.on_commit(lambda: broker.publish(type, model, pk, data))
+
+
+def get_serializers():
+    from manger.api.serializers import BabySerializer, JournalSerializer
+    return {'baby': BabySerializer, 'journal': JournalSerializer}
+
+
+def on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    model = sender._meta.model_name
+    data = get_serializers()[model](instance).data
+    publish_on_commit(CREATED if created else UPDATED, model, instance.pk, data)
+
+
+def on_delete(sender, instance, **kwargs):
+    publish_on_commit(DELETED, sender._meta.model_name, instance.pk)
+
+
+def publish_bulk(model, created=(), updated=()):
+    """
+    Для ``bulk_create``/``bulk_update``, которые не посылают сигналов.
+    Вызывается в транзакции записи. Если база не вернула id созданных
+    записей (SQLite), они находятся одним запросом по версиям, выделенным
+    ``stamp``; ``reset`` уходит, только если и так найти не удалось.
+    """
+    serializer_class = get_serializers()[model]
+    for instance in updated:
+        publish_on_commit(UPDATED, model, instance.pk, serializer_class(instance).data)
+
+    missing = [instance for instance in created if instance.pk is None]
+    if missing and all(instance.version is not None for instance in missing):
+        versions = [instance.version for instance in missing]
+        ids = dict(
+            serializer_class.Meta.model.objects.filter(version__range=(min(versions), max(versions)))
+            .values_list('version', 'id')
+        )
+        for instance in missing:
+            instance.pk = ids.get(instance.version)
+
+    if any(instance.pk is None for instance in created):
+        publish_on_commit(RESET)
+        return
+    for instance in created:
+        publish_on_commit(CREATED, model, instance.pk, serializer_class(instance).data)
+
+
+def format_events(events):
+    chunk = []
+    for event in events:
+        data = json.dumps(broker.to_dict(event), cls=DjangoJSONEncoder, ensure_ascii=False)
+        chunk.append('id: %s\nevent: %s\ndata: %s\n\n' % (broker.format_id(event.seq), event.type, data))
+    return ''.join(chunk)
+
+
+def iter_stream(seq, keepalive=15, duration=300):
+    """
+    Текст Server-Sent Events. Поток закрывается через ``duration`` секунд,
+    браузер переподключается сам и продолжает с ``Last-Event-ID``.
+    """
+    yield 'retry: 1000\n\n'
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        events, last = broker.wait(seq, min(keepalive, max(deadline - time.monotonic(), 0)))
+        if not events:
+            yield ': keepalive\n\n'
+            continue
+        yield format_events(events)
+        seq = last
+
+
+async def aiter_stream(seq, keepalive=15, duration=300):
+    """
+    ``iter_stream`` для ASGI: ожидание событий не занимает поток.
+    """
+    yield 'retry: 1000\n\n'
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        events, last = await broker.wait_async(seq, min(keepalive, max(deadline - time.monotonic(), 0)))
+        if not events:
+            yield ': keepalive\n\n'
+            continue
+        yield format_events(events)
+        seq = last
+
+
+STREAM_HEADERS = (
+    ('Content-Type', 'text/event-stream'),
+    ('Cache-Control', 'no-cache'),
+    ('X-Accel-Buffering', 'no'),
+)
+
+
+def stream_view(request):
+    """
+    Лента в формате ``text/event-stream``; продолжение — по заголовку
+    ``Last-Event-ID`` или параметру ``since``.
+    """
+    seq = broker.parse_id(request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since'))
+    response = StreamingHttpResponse(iter_stream(seq))
+    for name, value in STREAM_HEADERS:
+        response[name] = value
+    return response
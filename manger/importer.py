@@ -0,0 +1,263 @@
+"""
+Потоковый импорт детей и истории журнала из CSV и NDJSON.
+
+Вход читается пачками строк, каждая пачка разбирается и проверяется теми же
+правилами, что и ``JournalSerializer.validate`` (по желанию — в пуле
+процессов). Строки журнала сразу приводятся к значениям для базы, поэтому
+запись — один ``executemany`` на пачку без создания моделей. В памяти
+держится только текущая пачка (с пулом — не больше двух на процесс) и
+словарь идентификаторов детей.
+"""
+import csv
+import json
+from collections import deque
+from itertools import islice
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from manger.models import Baby, Journal, SyncVersion
+
+FORMATS = ('csv', 'ndjson')
+
+JOURNAL_COLUMNS = ('baby', 'income_time', 'income_escort', 'outcome_time', 'outcome_escort')
+ESCORTS = {str(value): value for value, _ in Journal.ESCORT_CHOICES}
+
+
+class RowError(Exception):
+    pass
+
+
+def read_batches(stream, fmt, batch_size):
+    """
+    Пачки ``(номер первой строки, строки)``; для CSV первая строка — заголовок
+    и возвращается отдельно. Многострочные поля CSV не поддерживаются.
+    """
+    header = None
+    line_no = 1
+    if fmt == 'csv':
+        header = next(csv.reader([next(stream, '')]))
+        line_no = 2
+
+    def batches():
+        nonlocal line_no
+        while True:
+            lines = list(islice(stream, batch_size))
+            if not lines:
+                return
+            yield line_no, lines
+            line_no += len(lines)
+
+    return header, batches()
+
+
+def blank(value):
+    return value is None or value == ''
+
+
+def parse_time(value, name):
+    if blank(value):
+        return None
+
+    try:
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise RowError({name: ['Datetime has wrong format']})
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_escort(value, name):
+    if blank(value):
+        return None
+
+    try:
+        return ESCORTS[str(value)]
+    except KeyError:
+        raise RowError({name: ['"%s" is not a valid choice.' % value]})
+
+
+class JournalRowParser:
+    """
+    Разбор записи журнала в кортеж значений ``JOURNAL_COLUMNS``, готовых
+    для ``insert_journal``.
+
+    ``babies`` отображает идентификатор ребенка во входных данных (строкой)
+    в id в базе — это единственный поиск детей на весь импорт.
+    """
+
+    def __init__(self, babies, fmt, header=None):
+        self.babies = babies
+        self.fmt = fmt
+        self.header = header
+        self.serializer = self.get_serializer()
+        self.fields = [Journal._meta.get_field(name) for name in JOURNAL_COLUMNS]
+
+    @staticmethod
+    def get_serializer():
+        # импорт откладывается: модуль используется и в процессах пула
+        from manger.api.serializers import JournalSerializer
+        return JournalSerializer()
+
+    def parse(self, record):
+        if not isinstance(record, dict):
+            raise RowError({'non_field_errors': ['Invalid data. Expected a dictionary']})
+
+        baby = record.get('baby')
+        if blank(baby):
+            raise RowError({'baby': ['This field is required.']})
+        try:
+            baby_id = self.babies[str(baby)]
+        except KeyError:
+            raise RowError({'baby': ['Invalid pk "%s" - object does not exist.' % baby]})
+
+        attrs = {
+            'income_time': parse_time(record.get('income_time'), 'income_time'),
+            'income_escort': parse_escort(record.get('income_escort'), 'income_escort'),
+            'outcome_time': parse_time(record.get('outcome_time'), 'outcome_time'),
+            'outcome_escort': parse_escort(record.get('outcome_escort'), 'outcome_escort'),
+        }
+        try:
+            self.serializer.validate(attrs)
+            self.serializer.check_outcome(attrs)
+        except serializers.ValidationError as exc:
+            raise RowError({'non_field_errors': exc.detail})
+
+        values = (baby_id, attrs['income_time'], attrs['income_escort'], attrs['outcome_time'], attrs['outcome_escort'])
+        return tuple(
+            field.get_db_prep_save(value, connection) for field, value in zip(self.fields, values)
+        )
+
+    def parse_batch(self, batch):
+        """
+        Возвращает ``(строки, ошибки)``; ошибка — ``(номер строки, описание)``.
+        """
+        line_no, lines = batch
+        rows, errors = [], []
+
+        if self.fmt == 'csv':
+            try:
+                items = [dict(zip(self.header, row)) for row in csv.reader(lines)]
+            except csv.Error as exc:
+                return rows, [(line_no, {'non_field_errors': ['Can not decode CSV: %s' % exc]})]
+        else:
+            items = lines
+
+        for offset, item in enumerate(items):
+            try:
+                if self.fmt == 'ndjson':
+                    if not item.strip():
+                        continue
+                    try:
+                        item = json.loads(item)
+                    except ValueError:
+                        raise RowError({'non_field_errors': ['Invalid JSON']})
+                rows.append(self.parse(item))
+            except RowError as exc:
+                errors.append((line_no + offset, exc.args[0]))
+
+        return rows, errors
+
+
+_worker_parser = None
+
+
+def init_worker(babies, fmt, header):
+    global _worker_parser
+    _worker_parser = JournalRowParser(babies, fmt, header)
+
+
+def parse_in_worker(batch):
+    return _worker_parser.parse_batch(batch)
+
+
+def parse_in_pool(pool, batches, limit):
+    """
+    ``(номер первой строки, результат parse_batch)`` по порядку пачек. В
+    работе не больше ``limit`` пачек: в отличие от ``Pool.imap``, разбор не
+    уходит вперед записи и разобранные пачки не копятся в памяти.
+    """
+    pending = deque()
+    for batch in batches:
+        pending.append((batch[0], pool.apply_async(parse_in_worker, (batch,))))
+        if len(pending) >= limit:
+            line_no, result = pending.popleft()
+            yield line_no, result.get()
+    while pending:
+        line_no, result = pending.popleft()
+        yield line_no, result.get()
+
+
+def load_baby_map(id_map=None):
+    """
+    Словарь «идентификатор во входных данных -> id ребенка».
+
+    Без ``id_map`` входные идентификаторы считаются id в базе. ``id_map`` —
+    CSV ``source_id,id``, который пишет ``import_babies``.
+    """
+    existing = set(Baby.objects.values_list('id', flat=True))
+    if id_map is None:
+        return {str(pk): pk for pk in existing}
+
+    babies = {}
+    for row in csv.DictReader(id_map):
+        pk = int(row['id'])
+        if pk in existing:
+            babies[row['source_id']] = pk
+    return babies
+
+
+def to_datetime(value):
+    """
+    Время прихода из строки ``JournalRowParser`` обратно в aware datetime:
+    SQLite хранит его строкой в UTC без зоны.
+    """
+    value = Journal._meta.get_field('income_time').to_python(value)
+    return timezone.make_aware(value, timezone.utc) if timezone.is_naive(value) else value
+
+
+def skip_existing(rows):
+    """
+    Строки, посещений которых еще нет в журнале; посещение определяется
+    ребенком и временем прихода. Повторный запуск прерванного импорта так
+    пропускает уже записанные пачки; строки без прихода не сравниваются и
+    записываются снова. Один запрос на пачку.
+    """
+    times = [to_datetime(row[1]) for row in rows if row[1] is not None]
+    if not times:
+        return rows
+
+    field = Journal._meta.get_field('income_time')
+    existing = Journal.objects.filter(
+        baby_id__in={row[0] for row in rows}, income_time__range=(min(times), max(times)),
+    ).values_list('baby_id', 'income_time')
+    existing = {(baby_id, field.get_db_prep_save(income_time, connection)) for baby_id, income_time in existing}
+    return [row for row in rows if (row[0], row[1]) not in existing]
+
+
+def insert_journal(rows):
+    """
+    Вставка строк от ``JournalRowParser`` одним ``executemany``; каждой строке
+    выделяется своя версия синхронизации.
+    """
+    if not rows:
+        return
+
+    first = SyncVersion.allocate(len(rows))
+    rows = [row + (version,) for version, row in enumerate(rows, first)]
+
+    quote = connection.ops.quote_name
+    columns = [Journal._meta.get_field(name).column for name in JOURNAL_COLUMNS + ('version',)]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote(Journal._meta.db_table),
+        ', '.join(quote(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
@@ -0,0 +1,234 @@
+"""
+Отложенная запись журнала через локальную очередь на диске.
+
+Проверенная ``JournalSerializer`` запись сразу кладется в отдельный файл
+SQLite (``MANGER_INGEST_QUEUE``) с fsync и подтверждается билетом. Один
+поток-писатель забирает записи пачками и применяет их к основной базе одной
+транзакцией на пачку, поэтому ожидание блокировки основной базы делится на
+всю пачку. Примененные билеты хранятся в ``IngestTicket`` в той же
+транзакции, что и запись журнала: после падения между коммитом в базу и
+отметкой в очереди повторное применение ничего не дублирует.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from manger.models import Baby, IngestTicket, Journal
+
+logger = logging.getLogger(__name__)
+
+PENDING, DONE, FAILED = 'pending', 'done', 'failed'
+
+FIELDS = ('baby', 'income_time', 'income_escort', 'outcome_time', 'outcome_escort')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    journal_id INTEGER,
+    errors TEXT,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS items_status_seq ON items (status, seq);
+'''
+
+
+class IngestQueue:
+    """
+    Очередь в файле SQLite; одно соединение на процесс под блокировкой.
+    """
+    retention = 24 * 60 * 60
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # подтверждение клиенту только после fsync
+        self.db.execute('PRAGMA synchronous=FULL')
+        self.db.executescript(SCHEMA)
+
+    def put(self, payload):
+        ticket = uuid.uuid4().hex
+        with self.lock:
+            self.db.execute(
+                'INSERT INTO items (ticket, payload, status, created) VALUES (?, ?, ?, ?)',
+                (ticket, json.dumps(payload), PENDING, time.time()),
+            )
+        self.wakeup.set()
+        return ticket
+
+    def pending(self, limit):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT ticket, payload FROM items WHERE status = ? ORDER BY seq LIMIT ?', (PENDING, limit),
+            ).fetchall()
+        return [(ticket, json.loads(payload)) for ticket, payload in rows]
+
+    def complete(self, results):
+        """
+        ``results`` — кортежи ``(билет, статус, id записи, ошибки)``.
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute('BEGIN')
+            self.db.executemany(
+                'UPDATE items SET status = ?, journal_id = ?, errors = ?, finished = ? WHERE ticket = ?',
+                [
+                    (status, journal_id, None if errors is None else json.dumps(errors), now, ticket)
+                    for ticket, status, journal_id, errors in results
+                ],
+            )
+            self.db.execute('DELETE FROM items WHERE status != ? AND finished < ?', (PENDING, now - self.retention))
+            self.db.execute('COMMIT')
+
+    def get(self, ticket):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT status, journal_id, errors FROM items WHERE ticket = ?', (ticket,),
+            ).fetchone()
+        if row is None:
+            return None
+        status, journal_id, errors = row
+        return status, journal_id, None if errors is None else json.loads(errors)
+
+
+def to_payload(serializer, fields=None):
+    """
+    JSON для очереди из проверенного сериализатора записи журнала. Для
+    обновления сохраняются только ``fields`` — поля, переданные клиентом:
+    остальные ``apply`` возьмет из записи, иначе снимок записи на момент
+    приема затер бы изменения, примененные раньше из той же очереди.
+    """
+    data = serializer.validated_data
+    payload = {name: data.get(name) for name in FIELDS if fields is None or name in fields}
+    if 'baby' in payload:
+        payload['baby'] = payload['baby'].pk
+    for name in ('income_time', 'outcome_time'):
+        if payload.get(name) is not None:
+            payload[name] = payload[name].isoformat()
+    if serializer.instance is not None:
+        payload['id'] = serializer.instance.pk
+    return payload
+
+
+def apply(items):
+    """
+    Применяет пачку ``(билет, payload)`` одной транзакцией; каждая запись —
+    в своей точке сохранения, поэтому отказ одной не откатывает остальные.
+    """
+    from manger.api.serializers import JournalSerializer
+
+    applied = dict(
+        IngestTicket.objects.filter(ticket__in=[ticket for ticket, _ in items]).values_list('ticket', 'journal_id')
+    )
+    results = []
+    with transaction.atomic():
+        # записи читаются в той же транзакции, в которой обновляются
+        records = Journal.objects.in_bulk({payload['id'] for _, payload in items if 'id' in payload})
+        baby_ids = {payload['baby'] for _, payload in items if 'baby' in payload}
+        baby_ids.update(record.baby_id for record in records.values())
+        context = {'babies': Baby.objects.in_bulk(baby_ids)}
+
+        for ticket, payload in items:
+            if ticket in applied:
+                results.append((ticket, DONE, applied[ticket], None))
+                continue
+
+            data = dict(payload)
+            instance = None
+            if 'id' in data:
+                instance = records.get(data.pop('id'))
+                if instance is None:
+                    results.append((ticket, FAILED, None, {'id': ['Record not found']}))
+                    continue
+                # поля, не переданные клиентом, — из текущего состояния записи
+                data = {**JournalSerializer.get_instance_data(instance), **data}
+
+            serializer = JournalSerializer(instance, data=data, context=context)
+            try:
+                serializer.is_valid(raise_exception=True)
+                with transaction.atomic():
+                    record = serializer.save()
+                    IngestTicket.objects.create(ticket=ticket, journal_id=record.pk)
+            except serializers.ValidationError as exc:
+                if instance is not None:
+                    instance.refresh_from_db()
+                results.append((ticket, FAILED, None, exc.detail))
+                continue
+
+            results.append((ticket, DONE, record.pk, None))
+    return results
+
+
+def drain(queue, batch_size):
+    """
+    Применяет все ожидающие записи очереди; возвращает их число.
+    """
+    count = 0
+    while True:
+        items = queue.pending(batch_size)
+        if not items:
+            break
+        queue.complete(apply(items))
+        count += len(items)
+
+    if count:
+        # билеты нужны, пока запись может остаться в очереди неотмеченной
+        IngestTicket.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=queue.retention),
+        ).delete()
+    return count
+
+
+class Writer(threading.Thread):
+    daemon = True
+
+    def __init__(self, queue, batch_size, interval=1.0):
+        super().__init__(name='manger-ingest')
+        self.queue = queue
+        self.batch_size = batch_size
+        self.interval = interval
+
+    def run(self):
+        while True:
+            self.queue.wakeup.wait(self.interval)
+            self.queue.wakeup.clear()
+            try:
+                drain(self.queue, self.batch_size)
+            except Exception:
+                # записи остаются в очереди и будут применены в следующий раз
+                logger.exception('ingest batch failed')
+            finally:
+                close_old_connections()
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Очередь процесса; при ``MANGER_INGEST_THREAD`` запускает поток-писатель,
+    который сначала дописывает то, что осталось после перезапуска.
+    """
+    path = settings.MANGER_INGEST_QUEUE
+    with _queues_lock:
+        if path not in _queues:
+            _queues[path] = IngestQueue(path)
+            if settings.MANGER_INGEST_THREAD:
+                Writer(_queues[path], settings.MANGER_INGEST_BATCH_SIZE).start()
+        return _queues[path]
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from manger import archive
+
+
+class Command(BaseCommand):
+    help = 'Переносит закрытые старые посещения из журнала в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.MANGER_ARCHIVE_AFTER_DAYS,
+                            help='переносить посещения, закрытые раньше, чем столько дней назад')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        # сводки посещений ищут архивные записи только старше MANGER_ARCHIVE_AFTER_DAYS
+        if options['days'] < settings.MANGER_ARCHIVE_AFTER_DAYS:
+            raise CommandError('--days can not be less than MANGER_ARCHIVE_AFTER_DAYS')
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        moved = 0
+        for count in archive.archive(cutoff, batch_size=options['batch_size']):
+            moved += count
+            self.stdout.write('%d visits archived' % moved)
+        self.stdout.write('done: %d visits archived' % moved)
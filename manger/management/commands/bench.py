@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from rest_framework.test import APIClient
+
+from manger import bench
+from manger.models import Journal
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный прогон всех маршрутов API на синтетических данных в тестовой базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--babies', type=int, default=5000)
+        parser.add_argument('--journal', type=int, default=2000000)
+        parser.add_argument('--requests', type=int, default=200, help='запросов на маршрут')
+        parser.add_argument('--route', action='append', help='только указанные маршруты')
+        parser.add_argument('--formats', action='store_true', help='сравнить размер и время кодирования форматов ответа')
+        parser.add_argument('--keepdb', action='store_true', help='не удалять тестовую базу и засеянные данные')
+
+    def handle(self, *args, **options):
+        names = options['route']
+        routes = [route for route in bench.ROUTES if not names or route.name in names]
+        if names and len(routes) != len(names):
+            raise CommandError('Unknown routes: %s' % ', '.join(set(names) - {route.name for route in routes}))
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            # синтетические отложенные записи не должны попасть в рабочую очередь
+            with tempfile.TemporaryDirectory() as directory, override_settings(
+                MANGER_INGEST_QUEUE=os.path.join(directory, 'ingest.sqlite3'), MANGER_INGEST_THREAD=False,
+            ):
+                failed = self.run(routes, options)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if failed:
+            raise CommandError('Query budget exceeded or errors: %s' % ', '.join(failed))
+
+    def run(self, routes, options):
+        if not Journal.objects.exists():
+            self.stdout.write('seeding %(babies)d babies, %(journal)d journal rows' % options)
+            bench.seed(options['babies'], options['journal'])
+            call_command('rebuild_attendance', stdout=self.stdout)
+
+        data = bench.Dataset()
+        client = APIClient()
+
+        self.stdout.write('%-20s %8s %10s %10s %10s %8s %7s' % ('route', 'req/s', 'p50, ms', 'p99, ms', 'queries', 'budget', 'errors'))
+        failed = []
+        for route in routes:
+            result = bench.run_route(client, route, data, options['requests'])
+            self.stdout.write('%-20s %8.1f %10.2f %10.2f %10d %8d %7d' % (
+                result.name, result.requests / result.seconds, result.p50 * 1000, result.p99 * 1000,
+                result.queries, result.max_queries, result.errors,
+            ))
+            if result.queries > result.max_queries or result.errors:
+                failed.append(result.name)
+
+        if options['formats']:
+            self.compare_formats(client, routes, data, options['requests'])
+        return failed
+
+    def compare_formats(self, client, routes, data, repeats):
+        self.stdout.write('')
+        self.stdout.write('%-20s %-16s %10s %10s %10s %12s' % ('route', 'format', 'bytes', 'gzip', 'brotli', 'encode, ms'))
+        for route in routes:
+            if route.method != 'get':
+                continue
+            for result in bench.measure_formats(client, route, data, repeats):
+                self.stdout.write('%-20s %-16s %10d %10d %10s %12.3f' % (
+                    result.route, result.name, result.size, result.gzip,
+                    '-' if result.brotli is None else result.brotli, result.seconds * 1000,
+                ))
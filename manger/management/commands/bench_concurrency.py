@@ -0,0 +1,43 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from manger import bench
+
+
+class Command(BaseCommand):
+    help = (
+        'Задержка запросов списка детей, пока открыто много ждущих long-poll соединений ленты: '
+        'многопоточный WSGI против ASGI с тем же числом потоков'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=200, help='ждущих long-poll соединений')
+        parser.add_argument('--requests', type=int, default=50, help='запросов списка детей')
+        parser.add_argument('--threads', type=int, default=32, help='потоков WSGI-сервера и пула ASGI')
+        parser.add_argument('--hold', type=int, default=2, help='таймаут long-poll, секунд')
+        parser.add_argument('--babies', type=int, default=100)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            bench.seed(options['babies'], options['babies'])
+            call_command('rebuild_attendance', stdout=self.stdout)
+            self.run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, options):
+        self.stdout.write('%-6s %12s %8s %9s %10s %10s %7s' % (
+            'mode', 'connections', 'threads', 'requests', 'p50, ms', 'p99, ms', 'errors',
+        ))
+        for measure in (bench.wsgi_concurrency, bench.asgi_concurrency):
+            result = measure(options['connections'], options['requests'], options['threads'], options['hold'])
+            self.stdout.write('%-6s %12d %8d %9d %10.2f %10.2f %7d' % (
+                result.mode, result.connections, result.threads, result.requests,
+                result.p50 * 1000, result.p99 * 1000, result.errors,
+            ))
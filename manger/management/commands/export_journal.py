@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from manger import export
+from manger.models import DailyAttendance
+
+
+def date_argument(value):
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(value)
+    return date
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка журнала в CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default='csv', dest='fmt')
+        parser.add_argument('--date-from', type=date_argument, help='YYYY-MM-DD, включительно')
+        parser.add_argument('--date-to', type=date_argument, help='YYYY-MM-DD, включительно')
+        parser.add_argument('--is-study', choices=('true', 'false'))
+        parser.add_argument('--archive', action='store_true', help='включить записи из архива')
+        parser.add_argument('--output', help='файл для выгрузки, по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        date_from, date_to = options['date_from'], options['date_to']
+        querysets = export.get_querysets(
+            date_from=DailyAttendance.day_start(date_from) if date_from else None,
+            date_to=DailyAttendance.day_start(date_to + timedelta(days=1)) if date_to else None,
+            is_study=None if options['is_study'] is None else options['is_study'] == 'true',
+            archive=options['archive'],
+        )
+        chunks = export.export(querysets, fmt=options['fmt'], chunk_size=options['chunk_size'])
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        try:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        except OSError as exc:
+            raise CommandError(exc)
@@ -0,0 +1,88 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from manger import importer
+from manger.api.cache import babies_cache
+from manger.api.serializers import BabySerializer
+from manger.models import Baby
+
+
+class Command(BaseCommand):
+    help = 'Импорт детей из CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл с детьми, "-" — stdin')
+        parser.add_argument('--format', choices=importer.FORMATS, dest='fmt',
+                            help='по умолчанию определяется по расширению файла')
+        parser.add_argument('--id-map-output', help='куда записать CSV source_id,id для import_journal')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path, fmt = options['path'], options['fmt']
+        if fmt is None:
+            fmt = 'csv' if path.endswith('.csv') else 'ndjson'
+
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            if fmt == 'csv':
+                records = csv.DictReader(stream)
+            else:
+                records = (json.loads(line) for line in stream if line.strip())
+            id_map = self.load(records, options['batch_size'])
+        except ValueError as exc:
+            raise CommandError('Can not decode input: %s' % exc)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        # bulk_create не шлет post_save
+        babies_cache.bump()
+        self.stdout.write('%d babies imported' % len(id_map))
+
+        if options['id_map_output']:
+            with open(options['id_map_output'], 'w', encoding='utf-8', newline='') as output:
+                writer = csv.writer(output)
+                writer.writerow(('source_id', 'id'))
+                writer.writerows((source_id, pk) for source_id, pk in id_map if source_id is not None)
+
+    def load(self, records, batch_size):
+        id_map, batch, invalid = [], [], 0
+
+        with transaction.atomic():
+            for line_no, record in enumerate(records, 1):
+                source_id = record.pop('id', None)
+                data = {field: value for field, value in record.items() if not importer.blank(value)}
+
+                serializer = BabySerializer(data=data)
+                if not serializer.is_valid():
+                    self.stderr.write('record %d: %s' % (line_no, serializer.errors))
+                    invalid += 1
+                    continue
+
+                batch.append((source_id, Baby(**serializer.validated_data)))
+                if len(batch) >= batch_size:
+                    id_map.extend(self.save(batch))
+                    batch = []
+
+            if invalid:
+                raise CommandError('Import aborted: %d invalid records, nothing was written' % invalid)
+            id_map.extend(self.save(batch))
+
+        return id_map
+
+    @staticmethod
+    def save(batch):
+        babies = [baby for _, baby in batch]
+        if connection.features.can_return_ids_from_bulk_insert:
+            Baby.stamp(babies)
+            Baby.objects.bulk_create(babies)
+        else:
+            # без RETURNING id новых записей из bulk_create не узнать
+            for baby in babies:
+                baby.save(force_insert=True)
+
+        return [(None if source_id is None else str(source_id), baby.pk) for source_id, baby in batch]
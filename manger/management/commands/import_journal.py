@@ -0,0 +1,98 @@
+import multiprocessing
+import sys
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections, transaction
+
+from manger import importer
+
+
+class Command(BaseCommand):
+    help = 'Импорт истории журнала из CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл с записями, "-" — stdin')
+        parser.add_argument('--format', choices=importer.FORMATS, dest='fmt',
+                            help='по умолчанию определяется по расширению файла')
+        parser.add_argument('--id-map', help='CSV source_id,id от import_babies')
+        parser.add_argument('--batch-size', type=int, default=20000)
+        parser.add_argument('--workers', type=int, default=0, help='процессов для разбора строк')
+        parser.add_argument('--skip-invalid', action='store_true', help='пропускать ошибочные строки')
+        parser.add_argument('--skip-attendance', action='store_true', help='не пересобирать дневные сводки')
+
+    def handle(self, *args, **options):
+        path, fmt = options['path'], options['fmt']
+        if fmt is None:
+            fmt = 'csv' if path.endswith('.csv') else 'ndjson'
+
+        if options['id_map']:
+            with open(options['id_map'], encoding='utf-8', newline='') as id_map:
+                babies = importer.load_baby_map(id_map)
+        else:
+            babies = importer.load_baby_map()
+
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            imported, skipped, invalid, seconds = self.load(stream, fmt, babies, options)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write('%d rows imported, %d already present, %d invalid, %.1f rows/s' % (
+            imported, skipped, invalid, imported / max(seconds, 1e-9),
+        ))
+
+        # пропущенные строки могли записаться прерванным запуском, сводки которого не пересобраны
+        if (imported or skipped) and not options['skip_attendance']:
+            call_command('rebuild_attendance', stdout=self.stdout)
+
+    def load(self, stream, fmt, babies, options):
+        header, batches = importer.read_batches(stream, fmt, options['batch_size'])
+        if header is not None and 'baby' not in header:
+            raise CommandError('CSV header must contain "baby" column')
+
+        pool = None
+        if options['workers']:
+            # процессы пула не должны унаследовать открытые соединения
+            connections.close_all()
+            pool = multiprocessing.Pool(
+                options['workers'], initializer=importer.init_worker, initargs=(babies, fmt, header),
+            )
+            results = importer.parse_in_pool(pool, batches, 2 * options['workers'])
+        else:
+            parser = importer.JournalRowParser(babies, fmt, header)
+            results = ((batch[0], parser.parse_batch(batch)) for batch in batches)
+
+        imported = skipped = invalid = 0
+        start = time.perf_counter()
+        # каждая пачка — своя транзакция: на SQLite блокировка записи держится
+        # только на время пачки, и отметки из API не ждут весь импорт.
+        # Прерванный импорт оставляет записанными предыдущие пачки, повторный
+        # запуск на том же файле их пропускает
+        try:
+            for batch_line_no, (rows, errors) in results:
+                for line_no, error in errors:
+                    self.stderr.write('line %d: %s' % (line_no, error))
+                invalid += len(errors)
+                if errors and not options['skip_invalid']:
+                    raise CommandError(
+                        'Import aborted: invalid rows, rows before line %d were written' % batch_line_no,
+                    )
+
+                try:
+                    with transaction.atomic():
+                        new_rows = importer.skip_existing(rows)
+                        importer.insert_journal(new_rows)
+                except IntegrityError as exc:
+                    raise CommandError(
+                        'Import aborted, rows before line %d were written: %s' % (batch_line_no, exc),
+                    )
+                imported += len(new_rows)
+                skipped += len(rows) - len(new_rows)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        return imported, skipped, invalid, time.perf_counter() - start
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from manger import ingest
+
+
+class Command(BaseCommand):
+    help = 'Применяет отложенные записи журнала из очереди на диске'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='применить накопленное и выйти')
+        parser.add_argument('--interval', type=float, default=0.2, help='пауза между проверками очереди, с')
+        parser.add_argument('--batch-size', type=int, default=settings.MANGER_INGEST_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        queue = ingest.IngestQueue(settings.MANGER_INGEST_QUEUE)
+
+        while True:
+            count = ingest.drain(queue, options['batch_size'])
+            if count:
+                self.stdout.write('%d records applied' % count)
+            if options['once']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from manger import sync
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые надгробия синхронизации'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='сколько дней хранить надгробия')
+
+    def handle(self, *args, **options):
+        count = sync.prune(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write('%d tombstones pruned' % count)
@@ -0,0 +1,45 @@
+from heapq import merge
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from manger.models import DailyAttendance, Journal, JournalArchive
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает дневные сводки посещений по журналу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        # архив тоже: сводки за старые дни строятся по перенесенным посещениям
+        querysets = (
+            model.objects.filter(
+                income_time__isnull=False,
+            ).order_by('baby_id', 'income_time').values_list(*DailyAttendance.VISIT_FIELDS)
+            for model in (Journal, JournalArchive)
+        )
+        records = merge(*(queryset.iterator(chunk_size=chunk_size) for queryset in querysets), key=itemgetter(0, 1))
+
+        def key(record):
+            return record[0], DailyAttendance.visit_date(record[1])
+
+        created, batch = 0, []
+        with transaction.atomic():
+            DailyAttendance.objects.all().delete()
+
+            for (baby_id, date), visits in groupby(records, key=key):
+                batch.append(DailyAttendance.from_visits(baby_id, date, (visit[1:] for visit in visits)))
+                if len(batch) >= chunk_size:
+                    DailyAttendance.objects.bulk_create(batch)
+                    created, batch = created + len(batch), []
+
+            DailyAttendance.objects.bulk_create(batch)
+            created += len(batch)
+
+        self.stdout.write('%d summaries rebuilt' % created)
@@ -0,0 +1,146 @@
+"""
+Метрики запросов в текстовом формате Prometheus.
+
+Для каждого view считаются гистограммы времени ответа и размера ответа,
+а для доли запросов ``MANGER_METRICS_SAMPLE_RATE`` — число и время
+SQL-запросов. Метрики хранятся в памяти процесса.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield '%g' % bound, cumulative
+        yield '+Inf', self.count
+
+
+class Registry:
+    METRICS = (
+        ('manger_http_request_duration_seconds', 'Request latency by view', LATENCY_BUCKETS),
+        ('manger_http_response_size_bytes', 'Response body size by view', SIZE_BUCKETS),
+        ('manger_db_queries', 'SQL queries per sampled request by view', QUERY_BUCKETS),
+        ('manger_db_query_duration_seconds', 'Total SQL time per sampled request by view', LATENCY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {
+                name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+                for name, _, buckets in self.METRICS
+            }
+
+    def observe(self, labels, duration, size=None, queries=None, query_time=None):
+        with self.lock:
+            self.histograms['manger_http_request_duration_seconds'][labels].observe(duration)
+            if size is not None:
+                self.histograms['manger_http_response_size_bytes'][labels].observe(size)
+            if queries is not None:
+                self.histograms['manger_db_queries'][labels].observe(queries)
+                self.histograms['manger_db_query_duration_seconds'][labels].observe(query_time)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, description, _ in self.METRICS:
+                lines.append('# HELP %s %s' % (name, description))
+                lines.append('# TYPE %s histogram' % name)
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    label_text = format_labels(labels)
+                    for bound, count in histogram.samples():
+                        lines.append('%s_bucket{%s,le="%s"} %d' % (name, label_text, bound, count))
+                    lines.append('%s_sum{%s} %s' % (name, label_text, repr(float(histogram.sum))))
+                    lines.append('%s_count{%s} %d' % (name, label_text, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    view, method, code = labels
+    return 'view="%s",method="%s",code="%s"' % (escape(view), escape(method), code)
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'MANGER_METRICS_SAMPLE_RATE', 1.0)
+        counter = QueryCounter() if random.random() < sample_rate else None
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            if counter is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        labels = (view, request.method, response.status_code)
+        size = None if response.streaming else len(response.content)
+
+        if counter is None:
+            registry.observe(labels, duration, size=size)
+        else:
+            registry.observe(labels, duration, size=size, queries=counter.count, query_time=counter.duration)
+        return response
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        raise Http404
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
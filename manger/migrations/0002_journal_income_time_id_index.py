@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manger', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='journal',
+            index=models.Index(fields=['income_time', 'id'], name='manger_jour_income__5d783b_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:19
+
+from django.db import migrations, models
+
+
+def close_duplicate_open_visits(apps, schema_editor):
+    """
+    До ограничения у ребенка могло остаться несколько открытых посещений
+    (забытый уход). Открытым остается только последнее, каждое более раннее
+    закрывается временем прихода следующего; сопровождающий ухода неизвестен
+    и берется тот же, что привел.
+    """
+    Journal = apps.get_model('manger', 'Journal')
+
+    open_visits = Journal.objects.filter(income_time__isnull=False, outcome_time__isnull=True)
+    baby_ids = (
+        open_visits.values('baby_id').annotate(count=models.Count('id')).filter(count__gt=1).values_list('baby_id', flat=True)
+    )
+    for baby_id in baby_ids:
+        visits = list(open_visits.filter(baby_id=baby_id).order_by('income_time', 'id'))
+        for visit, following in zip(visits, visits[1:]):
+            visit.outcome_time = following.income_time
+            visit.outcome_escort = visit.income_escort
+            visit.save(update_fields=['outcome_time', 'outcome_escort'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manger', '0002_journal_income_time_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='journal',
+            index=models.Index(fields=['baby', 'outcome_time'], name='manger_jour_baby_id_6e4a9d_idx'),
+        ),
+        migrations.RunPython(close_duplicate_open_visits, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='journal',
+            constraint=models.UniqueConstraint(condition=models.Q(('income_time__isnull', False), ('outcome_time__isnull', True)), fields=('baby',), name='unique_open_visit_per_baby'),
+        ),
+    ]
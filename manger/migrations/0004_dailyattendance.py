@@ -0,0 +1,36 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manger', '0003_journal_open_visit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('first_income_time', models.DateTimeField(verbose_name='Первое прибытие')),
+                ('first_income_escort', models.SmallIntegerField(choices=[(0, 'отец'), (1, 'мать')], null=True, verbose_name='Сопровождающее лицо')),
+                ('last_outcome_time', models.DateTimeField(null=True, verbose_name='Последний уход')),
+                ('last_outcome_escort', models.SmallIntegerField(choices=[(0, 'отец'), (1, 'мать')], null=True, verbose_name='Сопровождающее лицо')),
+                ('minutes', models.PositiveIntegerField(default=0, verbose_name='Минут на месте')),
+                ('visits', models.PositiveSmallIntegerField(default=0, verbose_name='Посещений')),
+                ('baby', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='manger.Baby', verbose_name='Ребенок')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailyattendance',
+            index=models.Index(fields=['date'], name='manger_dail_date_18a18a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyattendance',
+            unique_together={('baby', 'date')},
+        ),
+    ]
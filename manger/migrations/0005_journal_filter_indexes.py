@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manger', '0004_dailyattendance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='baby',
+            name='is_study',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='Учится?'),
+        ),
+        migrations.AddIndex(
+            model_name='journal',
+            index=models.Index(fields=['baby', 'income_time'], name='manger_jour_baby_id_0219e2_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:37
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def backfill_versions(apps, schema_editor):
+    """
+    Существующим записям — различные версии, чтобы первая синхронизация
+    постранично забрала их все.
+    """
+    Baby = apps.get_model('manger', 'Baby')
+    Journal = apps.get_model('manger', 'Journal')
+    SyncVersion = apps.get_model('manger', 'SyncVersion')
+
+    offset = Baby.objects.aggregate(value=models.Max('id'))['value'] or 0
+    last = Journal.objects.aggregate(value=models.Max('id'))['value'] or 0
+
+    Baby.objects.update(version=models.F('id'))
+    Journal.objects.update(version=models.F('id') + offset)
+    SyncVersion.objects.create(pk=1, value=offset + last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manger', '0005_journal_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+                ('pruned', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20, verbose_name='Модель')),
+                ('object_id', models.IntegerField(verbose_name='Id записи')),
+                ('version', models.BigIntegerField(db_index=True, verbose_name='Версия')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Удалена')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='baby',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Версия'),
+        ),
+        migrations.AddField(
+            model_name='journal',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Версия'),
+        ),
+        migrations.RunPython(backfill_versions, migrations.RunPython.noop),
+    ]
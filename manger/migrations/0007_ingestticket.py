@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manger', '0006_sync_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestTicket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket', models.CharField(max_length=32, unique=True, verbose_name='Билет')),
+                ('journal_id', models.IntegerField(verbose_name='Id записи')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Создан')),
+            ],
+        ),
+    ]
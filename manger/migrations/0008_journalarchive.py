@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manger', '0007_ingestticket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalArchive',
+            fields=[
+                ('income_time', models.DateTimeField(null=True, verbose_name='Время прибытия')),
+                ('income_escort', models.SmallIntegerField(choices=[(0, 'отец'), (1, 'мать')], null=True, verbose_name='Сопровождающее лицо')),
+                ('outcome_time', models.DateTimeField(null=True, verbose_name='Время прибытия')),
+                ('outcome_escort', models.SmallIntegerField(choices=[(0, 'отец'), (1, 'мать')], null=True, verbose_name='Сопровождающее лицо')),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('baby', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='manger.Baby', verbose_name='Ребенок')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='journalarchive',
+            index=models.Index(fields=['income_time', 'id'], name='manger_jour_income__55e03b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journalarchive',
+            index=models.Index(fields=['baby', 'income_time'], name='manger_jour_baby_id_b151ed_idx'),
+        ),
+    ]
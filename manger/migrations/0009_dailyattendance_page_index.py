@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manger', '0008_journalarchive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dailyattendance',
+            name='manger_dail_date_18a18a_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dailyattendance',
+            index=models.Index(fields=['date', 'baby'], name='manger_dail_date_b1271d_idx'),
+        ),
+    ]
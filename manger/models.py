@@ -1,7 +1,105 @@
-from django.db import models
+import sqlite3
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
 
-class Baby(models.Model):
+
+class SyncVersion(models.Model):
+    """
+    Счетчик версий для синхронизации планшетов: одна строка на все таблицы.
+
+    ``pruned`` — версия, до которой удалены старые надгробия; клиент с более
+    старой версией должен загрузить данные заново.
+    """
+    value = models.BigIntegerField(default=0)
+    pruned = models.BigIntegerField(default=0)
+
+    @classmethod
+    def allocate(cls, count=1):
+        """
+        Выделяет ``count`` версий подряд и возвращает первую. Вызывается внутри
+        транзакции: строка счетчика заблокирована до коммита, поэтому версии
+        становятся видны клиентам по возрастанию.
+        """
+        if supports_update_returning(connection):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'UPDATE %s SET value = value + %%s WHERE id = 1 RETURNING value' % cls._meta.db_table, [count],
+                )
+                row = cursor.fetchone()
+            value = row[0] if row else None
+        elif cls.objects.filter(pk=1).update(value=models.F('value') + count):
+            value = cls.objects.values_list('value', flat=True).get(pk=1)
+        else:
+            value = None
+
+        if value is None:
+            cls.objects.create(pk=1, value=count)
+            return 1
+        return value - count + 1
+
+
+def supports_update_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35)
+
+
+class Versioned(models.Model):
+    """
+    Модель с версией последнего изменения; ``save`` выделяет новую версию,
+    пакетные операции ставят ее через ``stamp``.
+    """
+    version = models.BigIntegerField('Версия', default=0, db_index=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+
+        with transaction.atomic(savepoint=False):
+            self.version = SyncVersion.allocate()
+            super().save(*args, **kwargs)
+
+    @staticmethod
+    def stamp(instances):
+        if not instances:
+            return
+        for version, instance in enumerate(instances, SyncVersion.allocate(len(instances))):
+            instance.version = version
+
+
+class Tombstone(models.Model):
+    """
+    След удаленной записи для синхронизации.
+    """
+    model = models.CharField('Модель', max_length=20)
+    object_id = models.IntegerField('Id записи')
+    version = models.BigIntegerField('Версия', db_index=True)
+    deleted_at = models.DateTimeField('Удалена', default=timezone.now)
+
+    def __str__(self):
+        return '%s %s' % (self.model, self.object_id)
+
+
+class IngestTicket(models.Model):
+    """
+    Билет записи из очереди ``manger.ingest``, примененной к журналу.
+    """
+    ticket = models.CharField('Билет', max_length=32, unique=True)
+    journal_id = models.IntegerField('Id записи')
+    created_at = models.DateTimeField('Создан', default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.ticket
+
+
+class Baby(Versioned):
     GENDER_MALE = 0
     GENDER_FEMALE = 1
 
@@ -20,13 +118,22 @@ class Baby(models.Model):
 
     photo = models.CharField('Фото', max_length=MAX_LENGTH_PHOTO, blank=True)
     grade = models.SmallIntegerField('Класс', null=True)
-    is_study = models.BooleanField('Учится?', default=False)
+    is_study = models.BooleanField('Учится?', default=False, db_index=True)
 
     def __str__(self):
         return '%s [%s]' % (self.name, self.birthday)
 
 
-class Journal(models.Model):
+class JournalQuerySet(models.QuerySet):
+    def present(self):
+        # условие совпадает с частичным индексом unique_open_visit_per_baby
+        return self.filter(income_time__isnull=False, outcome_time__isnull=True)
+
+
+class Visit(models.Model):
+    """
+    Поля посещения, общие для журнала и его архива.
+    """
     ESCORT_FATHER = 0
     ESCORT_MOTHER = 1
 
@@ -46,5 +153,172 @@ class Journal(models.Model):
     outcome_time = models.DateTimeField('Время прибытия', null=True)
     outcome_escort = models.SmallIntegerField('Сопровождающее лицо', choices=ESCORT_CHOICES, null=True)
 
+    class Meta:
+        abstract = True
+
     def __str__(self):
         return '%s: %s - %s ' % (self.baby, self.income_time or '***', self.outcome_time or '***')
+
+
+class Journal(Visit, Versioned):
+    objects = JournalQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset-пагинация журнала
+            models.Index(fields=['income_time', 'id']),
+            models.Index(fields=['baby', 'outcome_time']),
+            models.Index(fields=['baby', 'income_time']),
+        ]
+        constraints = [
+            # не больше одного незакрытого посещения на ребенка
+            models.UniqueConstraint(
+                fields=['baby'],
+                condition=models.Q(income_time__isnull=False, outcome_time__isnull=True),
+                name='unique_open_visit_per_baby',
+            ),
+        ]
+
+
+class JournalArchive(Visit):
+    """
+    Закрытые посещения старше срока ``MANGER_ARCHIVE_AFTER_DAYS``, перенесенные
+    из журнала командой ``archive_journal``. Id сохраняется прежним.
+    """
+    id = models.IntegerField(primary_key=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['income_time', 'id']),
+            models.Index(fields=['baby', 'income_time']),
+        ]
+
+
+class DailyAttendance(models.Model):
+    """
+    Сводка посещений ребенка за день.
+
+    Пересчитывается по затронутым парам (ребенок, день) при записи в журнал,
+    полностью — командой ``rebuild_attendance``.
+    """
+    baby = models.ForeignKey(Baby, verbose_name='Ребенок', on_delete=models.CASCADE)
+    date = models.DateField('Дата')
+
+    first_income_time = models.DateTimeField('Первое прибытие')
+    first_income_escort = models.SmallIntegerField('Сопровождающее лицо', choices=Journal.ESCORT_CHOICES, null=True)
+    last_outcome_time = models.DateTimeField('Последний уход', null=True)
+    last_outcome_escort = models.SmallIntegerField('Сопровождающее лицо', choices=Journal.ESCORT_CHOICES, null=True)
+
+    minutes = models.PositiveIntegerField('Минут на месте', default=0)
+    visits = models.PositiveSmallIntegerField('Посещений', default=0)
+
+    VISIT_FIELDS = ('baby_id', 'income_time', 'income_escort', 'outcome_time', 'outcome_escort')
+    # отрезков дней на один запрос refresh
+    REFRESH_RANGES = 100
+
+    class Meta:
+        unique_together = ('baby', 'date')
+        indexes = [
+            # ключ страниц списка сводок
+            models.Index(fields=['date', 'baby']),
+        ]
+
+    def __str__(self):
+        return '%s: %s' % (self.baby_id, self.date)
+
+    @staticmethod
+    def visit_date(income_time):
+        return timezone.localtime(income_time).date() if settings.USE_TZ else income_time.date()
+
+    @staticmethod
+    def day_start(date):
+        start = datetime.combine(date, time.min)
+        return timezone.make_aware(start) if settings.USE_TZ else start
+
+    @classmethod
+    def from_visits(cls, baby_id, date, visits):
+        """
+        Строит сводку по посещениям одного дня — кортежам
+        ``(income_time, income_escort, outcome_time, outcome_escort)``.
+        """
+        summary = cls(baby_id=baby_id, date=date)
+
+        for income_time, income_escort, outcome_time, outcome_escort in visits:
+            summary.visits += 1
+
+            if summary.first_income_time is None or income_time < summary.first_income_time:
+                summary.first_income_time, summary.first_income_escort = income_time, income_escort
+
+            if outcome_time is None:
+                continue
+
+            summary.minutes += int((outcome_time - income_time).total_seconds()) // 60
+            if summary.last_outcome_time is None or outcome_time > summary.last_outcome_time:
+                summary.last_outcome_time, summary.last_outcome_escort = outcome_time, outcome_escort
+
+        return summary
+
+    @classmethod
+    def keys_for(cls, *records):
+        return {
+            (record.baby_id, cls.visit_date(record.income_time))
+            for record in records if record is not None and record.income_time is not None
+        }
+
+    @staticmethod
+    def group_keys(keys):
+        """
+        Пары ``(baby_id, date)`` — в отрезки подряд идущих дней
+        ``[первый день, последний день, {baby_id}]`` по возрастанию дат.
+        """
+        babies_by_date = defaultdict(set)
+        for baby_id, date in keys:
+            babies_by_date[date].add(baby_id)
+
+        ranges = []
+        for date in sorted(babies_by_date):
+            if ranges and ranges[-1][1] + timedelta(days=1) == date:
+                ranges[-1][1] = date
+                ranges[-1][2] |= babies_by_date[date]
+            else:
+                ranges.append([date, date, set(babies_by_date[date])])
+        return ranges
+
+    @classmethod
+    def refresh(cls, keys):
+        """
+        Пересчитывает сводки для пар ``(baby_id, date)``. Журнал читается
+        только за затронутые отрезки дней — правка старого посещения не
+        читает все между ним и сегодняшним днем; до ``REFRESH_RANGES``
+        отрезков на запрос.
+        """
+        ranges = cls.group_keys(keys)
+        for start in range(0, len(ranges), cls.REFRESH_RANGES):
+            cls.refresh_ranges(ranges[start:start + cls.REFRESH_RANGES])
+
+    @classmethod
+    def refresh_ranges(cls, ranges):
+        visits_filter, summaries_filter = models.Q(), models.Q()
+        for first, last, baby_ids in ranges:
+            visits_filter |= models.Q(
+                baby_id__in=baby_ids,
+                income_time__gte=cls.day_start(first),
+                income_time__lt=cls.day_start(last + timedelta(days=1)),
+            )
+            summaries_filter |= models.Q(baby_id__in=baby_ids, date__range=(first, last))
+
+        visits = defaultdict(list)
+        records = Journal.objects.filter(visits_filter).values_list(*cls.VISIT_FIELDS)
+        # в дни, начавшиеся раньше границы архивации, часть посещений может быть уже в архиве
+        if cls.day_start(ranges[0][0]) < timezone.now() - timedelta(days=settings.MANGER_ARCHIVE_AFTER_DAYS):
+            records = records.union(
+                JournalArchive.objects.filter(visits_filter).values_list(*cls.VISIT_FIELDS), all=True,
+            )
+        for baby_id, *visit in records:
+            visits[baby_id, cls.visit_date(visit[0])].append(visit)
+
+        with transaction.atomic():
+            cls.objects.filter(summaries_filter).delete()
+            cls.objects.bulk_create(
+                cls.from_visits(baby_id, date, day_visits) for (baby_id, date), day_visits in visits.items()
+            )
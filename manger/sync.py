@@ -0,0 +1,33 @@
+"""
+Дельта-синхронизация планшетов.
+
+У детей и записей журнала есть версия последнего изменения из общего
+счетчика ``SyncVersion``, удаления оставляют надгробия ``Tombstone``.
+Клиент запрашивает изменения после известной ему версии и получает только
+их, поэтому стоимость синхронизации зависит от объема изменений, а не от
+размера таблиц.
+"""
+from django.db import transaction
+
+from manger.models import SyncVersion, Tombstone
+
+
+def on_delete(sender, instance, **kwargs):
+    # срабатывает и для каскадного удаления записей журнала вместе с ребенком
+    Tombstone.objects.create(model=sender._meta.model_name, object_id=instance.pk, version=SyncVersion.allocate())
+
+
+def prune(before):
+    """
+    Удаляет надгробия старше ``before``; клиенты, не синхронизировавшиеся
+    с тех пор, получат ``reset``. Возвращает число удаленных.
+    """
+    with transaction.atomic():
+        tombstones = Tombstone.objects.filter(deleted_at__lt=before)
+        last = tombstones.order_by('-version').values_list('version', flat=True).first()
+        if last is None:
+            return 0
+
+        count, _ = Tombstone.objects.filter(version__lte=last).delete()
+        SyncVersion.objects.filter(pk=1, pruned__lt=last).update(pruned=last)
+    return count
@@ -1,11 +1,39 @@
-from datetime import datetime, timedelta
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
+import msgpack
 import pytz
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, router, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework import serializers, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
 
-from manger.models import Baby, Journal
+from manger import bench, export, feed, ingest, thumbnails
+from manger.api import compression, views
+from manger.asgi import ASGIHandler
+from manger.api.filters import JournalFilterBackend
+from manger.api.rows import RowSerializer
+from manger.api.serializers import BabySerializer, JournalSerializer
+from manger.babies import baby_cache
+from manger.db import ReplicaRouter, replica_reads
+from manger.metrics import registry
+from manger.models import Baby, DailyAttendance, Journal, JournalArchive
 
 
 class APIBabyTests(APITestCase):
@@ -224,4 +252,1560 @@ class APIJournalTests(APITestCase):
         response = self.client.get(reverse('journal-study'))
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertSetEqual({j1_1.id, j1_2.id, j3.id}, set([record['id'] for record in response.json()]))
+        self.assertSetEqual({j1_1.id, j1_2.id, j3.id}, set([record['id'] for record in response.json()['results']]))
+
+
+class APIJournalPaginationTests(APITestCase):
+    URL_JOURNAL_LIST = reverse('journal-list')
+
+    def setUp(self):
+        self.baby = Baby.objects.create(name='Петр', gender=Baby.GENDER_MALE, birthday='2010-10-01')
+        income_time = datetime(2010, 2, 1, 8, 0, 0, tzinfo=pytz.utc)
+
+        # записи без прибытия, с одинаковым и с разным временем прибытия
+        self.records = [Journal.objects.create(baby=self.baby) for _ in range(2)]
+        for i in range(5):
+            self.records.append(Journal.objects.create(
+                baby=self.baby,
+                income_time=income_time + timedelta(minutes=i // 2),
+                income_escort=Journal.ESCORT_FATHER,
+                outcome_time=income_time + timedelta(hours=8),
+                outcome_escort=Journal.ESCORT_MOTHER,
+            ))
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(record['id'] for record in response.json()['results'])
+            url = response.json()['next']
+        return ids
+
+    def test_walk_forward(self):
+        ids = self.collect(self.URL_JOURNAL_LIST + '?page_size=2')
+
+        self.assertListEqual([record.id for record in self.records], ids)
+
+    def test_walk_backward(self):
+        response = self.client.get(self.URL_JOURNAL_LIST + '?page_size=3')
+        response = self.client.get(response.json()['next'])
+        response = self.client.get(response.json()['previous'])
+
+        self.assertListEqual([record.id for record in self.records[:3]],
+                             [record['id'] for record in response.json()['results']])
+        self.assertIsNone(response.json()['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.URL_JOURNAL_LIST + '?cursor=garbage')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class APIJournalBulkTests(APITestCase):
+    URL_JOURNAL_BULK = reverse('journal-bulk')
+
+    def setUp(self):
+        self.babies = [
+            Baby.objects.create(name='Name%d' % i, gender=Baby.GENDER_MALE, birthday='2010-10-01')
+            for i in range(3)
+        ]
+        self.income_time = datetime(2010, 2, 1, 8, 30, 0, tzinfo=pytz.utc)
+        self.outcome_time = self.income_time + timedelta(hours=8)
+
+    def test_bulk_income(self):
+        items = [
+            {'baby': baby.id, 'income_time': str(self.income_time), 'income_escort': Journal.ESCORT_MOTHER}
+            for baby in self.babies
+        ]
+        # число запросов не зависит от размера пакета
+        with self.assertNumQueries(12):
+            response = self.client.post(self.URL_JOURNAL_BULK, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertDictEqual({'created': 3, 'updated': 0}, response.json())
+        self.assertSetEqual({baby.id for baby in self.babies}, set(Journal.objects.values_list('baby', flat=True)))
+
+    def test_bulk_outcome(self):
+        records = [
+            Journal.objects.create(baby=baby, income_time=self.income_time, income_escort=Journal.ESCORT_FATHER)
+            for baby in self.babies
+        ]
+        items = [
+            {'id': record.id, 'outcome_time': str(self.outcome_time), 'outcome_escort': Journal.ESCORT_MOTHER}
+            for record in records
+        ]
+        response = self.client.post(self.URL_JOURNAL_BULK, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertDictEqual({'created': 0, 'updated': 3}, response.json())
+        for record in records:
+            record.refresh_from_db()
+            self.assertEqual(record.income_time, self.income_time)
+            self.assertEqual(record.outcome_time, self.outcome_time)
+            self.assertEqual(record.outcome_escort, Journal.ESCORT_MOTHER)
+
+    def test_bulk_errors_per_item(self):
+        record = Journal.objects.create(baby=self.babies[0])
+        items = [
+            {'baby': self.babies[0].id, 'income_time': str(self.income_time), 'income_escort': Journal.ESCORT_FATHER},
+            # нет сопровождающего
+            {'baby': self.babies[1].id, 'income_time': str(self.income_time)},
+            # несуществующий ребенок
+            {'baby': 100500},
+            # уход без прихода
+            {'id': record.id, 'outcome_time': str(self.outcome_time), 'outcome_escort': Journal.ESCORT_MOTHER},
+        ]
+        response = self.client.post(self.URL_JOURNAL_BULK, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.json()
+        self.assertEqual(len(errors), len(items))
+        self.assertDictEqual({}, errors[0])
+        self.assertIn('non_field_errors', errors[1])
+        self.assertIn('baby', errors[2])
+        self.assertIn('non_field_errors', errors[3])
+
+        # ничего не записано
+        self.assertEqual(Journal.objects.count(), 1)
+        record.refresh_from_db()
+        self.assertIsNone(record.outcome_time)
+
+    def test_bulk_open_visit_conflicts(self):
+        open_record = Journal.objects.create(
+            baby=self.babies[0], income_time=self.income_time, income_escort=Journal.ESCORT_FATHER,
+        )
+        closed_record = Journal.objects.create(
+            baby=self.babies[2], income_time=self.income_time, income_escort=Journal.ESCORT_FATHER,
+        )
+        income = {'income_time': str(self.outcome_time), 'income_escort': Journal.ESCORT_MOTHER}
+        items = [
+            # у ребенка уже открыто посещение
+            {'baby': self.babies[0].id, **income},
+            {'baby': self.babies[1].id, **income},
+            # второй приход в том же пакете
+            {'baby': self.babies[1].id, **income},
+            # уход и новый приход в одном пакете допустимы
+            {'baby': self.babies[2].id, **income},
+            {'id': closed_record.id, 'outcome_time': str(self.outcome_time), 'outcome_escort': Journal.ESCORT_MOTHER},
+        ]
+        with self.assertNumQueries(3):
+            response = self.client.post(self.URL_JOURNAL_BULK, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertListEqual(response.json(), [
+            {'non_field_errors': [JournalSerializer.OPEN_VISIT_EXISTS_MESSAGE]},
+            {},
+            {'non_field_errors': [views.JournalBulkView.OPEN_VISIT_IN_BATCH_MESSAGE]},
+            {},
+            {},
+        ])
+        self.assertListEqual(list(Journal.objects.values_list('id', flat=True)), [open_record.id, closed_record.id])
+
+        # без конфликтов пакет проходит
+        response = self.client.post(self.URL_JOURNAL_BULK, items[1:2] + items[3:], format='json')
+        self.assertDictEqual({'created': 2, 'updated': 1}, response.json())
+
+    def test_bulk_not_a_list(self):
+        response = self.client.post(self.URL_JOURNAL_BULK, {'baby': self.babies[0].id}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class APIJournalPresentTests(APITestCase):
+    URL_JOURNAL_LIST = reverse('journal-list')
+    URL_JOURNAL_PRESENT = reverse('journal-present')
+
+    def setUp(self):
+        self.baby = Baby.objects.create(name='Петр', gender=Baby.GENDER_MALE, birthday='2010-10-01')
+        self.other = Baby.objects.create(name='Иван', gender=Baby.GENDER_MALE, birthday='2010-10-02')
+        self.income_time = datetime(2010, 2, 1, 8, 30, 0, tzinfo=pytz.utc)
+        self.outcome_time = self.income_time + timedelta(hours=8)
+
+    def createOpenRecord(self, baby):
+        return Journal.objects.create(baby=baby, income_time=self.income_time, income_escort=Journal.ESCORT_FATHER)
+
+    def test_present(self):
+        record = self.createOpenRecord(self.baby)
+        Journal.objects.create(
+            baby=self.other,
+            income_time=self.income_time, income_escort=Journal.ESCORT_FATHER,
+            outcome_time=self.outcome_time, outcome_escort=Journal.ESCORT_MOTHER,
+        )
+
+        response = self.client.get(self.URL_JOURNAL_PRESENT)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([record.id], [item['id'] for item in response.json()])
+
+    def test_second_open_visit(self):
+        self.createOpenRecord(self.baby)
+        params = {'baby': self.baby.id, 'income_time': str(self.income_time), 'income_escort': Journal.ESCORT_MOTHER}
+        response = self.client.post(self.URL_JOURNAL_LIST, params)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Journal.objects.count(), 1)
+
+    def test_checkout(self):
+        record = self.createOpenRecord(self.baby)
+        url_checkout = reverse('baby-checkout', kwargs={'pk': self.baby.pk})
+
+        with self.assertNumQueries(10):
+            response = self.client.post(url_checkout, {
+                'outcome_time': str(self.outcome_time),
+                'outcome_escort': Journal.ESCORT_MOTHER,
+            })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        record.refresh_from_db()
+        self.assertEqual(record.outcome_time, self.outcome_time)
+        self.assertEqual(record.outcome_escort, Journal.ESCORT_MOTHER)
+
+    def test_checkout_without_open_visit(self):
+        url_checkout = reverse('baby-checkout', kwargs={'pk': self.baby.pk})
+        response = self.client.post(url_checkout, {'outcome_escort': Journal.ESCORT_MOTHER})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DailyAttendanceTests(APITestCase):
+    URL_JOURNAL_LIST = reverse('journal-list')
+    URL_ATTENDANCE_LIST = reverse('attendance-list')
+
+    def setUp(self):
+        self.baby = Baby.objects.create(name='Петр', gender=Baby.GENDER_MALE, birthday='2010-10-01')
+        self.income_time = datetime(2010, 2, 1, 8, 0, 0, tzinfo=pytz.utc)
+        self.outcome_time = self.income_time + timedelta(hours=2)
+
+    def post_visit(self, income_time, outcome_time=None):
+        params = {
+            'baby': self.baby.id,
+            'income_time': str(income_time),
+            'income_escort': Journal.ESCORT_FATHER,
+        }
+        if outcome_time:
+            params.update(outcome_time=str(outcome_time), outcome_escort=Journal.ESCORT_MOTHER)
+        response = self.client.post(self.URL_JOURNAL_LIST, params)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()
+
+    def get_summary(self):
+        return DailyAttendance.objects.get(baby=self.baby, date=self.income_time.date())
+
+    def test_incremental_update(self):
+        self.post_visit(self.income_time, self.outcome_time)
+        record = self.post_visit(self.income_time + timedelta(hours=4))
+
+        summary = self.get_summary()
+        self.assertEqual(summary.visits, 2)
+        self.assertEqual(summary.minutes, 120)
+        self.assertEqual(summary.first_income_time, self.income_time)
+        self.assertEqual(summary.last_outcome_time, self.outcome_time)
+
+        # закрываем второе посещение
+        url_journal_detail = reverse('journal-detail', kwargs={'pk': record['id']})
+        response = self.client.put(url_journal_detail, {
+            'baby': self.baby.id,
+            'income_time': str(self.income_time + timedelta(hours=4)),
+            'income_escort': Journal.ESCORT_FATHER,
+            'outcome_time': str(self.income_time + timedelta(hours=5)),
+            'outcome_escort': Journal.ESCORT_FATHER,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        summary = self.get_summary()
+        self.assertEqual(summary.minutes, 180)
+        self.assertEqual(summary.last_outcome_escort, Journal.ESCORT_FATHER)
+
+        # удаление посещения
+        self.client.delete(url_journal_detail)
+        summary = self.get_summary()
+        self.assertEqual(summary.visits, 1)
+        self.assertEqual(summary.minutes, 120)
+
+    def test_update_at_archive_cutoff(self):
+        # день, в котором проходит граница архивации: первое посещение уже в архиве
+        cutoff = datetime.now(pytz.utc).replace(microsecond=0) - timedelta(days=settings.MANGER_ARCHIVE_AFTER_DAYS)
+        income_time = cutoff - timedelta(minutes=2)
+        day_start = DailyAttendance.day_start(DailyAttendance.visit_date(income_time))
+        self.post_visit(day_start, day_start + timedelta(seconds=1))
+        record = self.post_visit(income_time)
+        call_command('archive_journal', stdout=StringIO())
+        self.assertEqual(JournalArchive.objects.count(), 1)
+
+        response = self.client.put(reverse('journal-detail', kwargs={'pk': record['id']}), {
+            'baby': self.baby.id,
+            'income_time': str(income_time),
+            'income_escort': Journal.ESCORT_FATHER,
+            'outcome_time': str(cutoff - timedelta(minutes=1)),
+            'outcome_escort': Journal.ESCORT_MOTHER,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        summary = DailyAttendance.objects.get(baby=self.baby, date=DailyAttendance.visit_date(income_time))
+        self.assertEqual(summary.visits, 2)
+
+    def test_refresh_distant_days(self):
+        for day in range(0, 301, 10):
+            self.post_visit(self.income_time + timedelta(days=day), self.outcome_time + timedelta(days=day))
+        DailyAttendance.objects.filter(date=self.income_time.date() + timedelta(days=150)).update(visits=5)
+        first, last = self.income_time.date(), self.income_time.date() + timedelta(days=300)
+
+        with CaptureQueriesContext(connection) as queries:
+            DailyAttendance.refresh({(self.baby.id, first), (self.baby.id, last)})
+
+        # читаются только два затронутых дня, сводки между ними не трогаются
+        select = next(query['sql'] for query in queries if 'FROM "manger_journal"' in query['sql'])
+        self.assertEqual(select.count('"manger_journal"."income_time" >='), 2)
+        self.assertListEqual(
+            list(DailyAttendance.objects.filter(date__in=[first, last]).values_list('visits', flat=True)), [1, 1],
+        )
+        self.assertEqual(DailyAttendance.objects.get(date=first + timedelta(days=150)).visits, 5)
+
+    def test_rebuild_command(self):
+        self.post_visit(self.income_time, self.outcome_time)
+        self.post_visit(self.income_time + timedelta(days=1), self.outcome_time + timedelta(days=1))
+        expected = list(DailyAttendance.objects.order_by('date').values_list('date', 'minutes', 'visits'))
+
+        DailyAttendance.objects.all().delete()
+        call_command('rebuild_attendance', chunk_size=1, stdout=StringIO())
+
+        self.assertListEqual(expected, list(DailyAttendance.objects.order_by('date').values_list('date', 'minutes', 'visits')))
+
+    def test_attendance_list(self):
+        self.post_visit(self.income_time, self.outcome_time)
+        self.post_visit(self.income_time + timedelta(days=1), self.outcome_time + timedelta(days=1))
+
+        response = self.client.get(self.URL_ATTENDANCE_LIST, {'date_from': '2010-02-02'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(['2010-02-02'], [item['date'] for item in response.json()['results']])
+
+        response = self.client.get(self.URL_ATTENDANCE_LIST, {'date_to': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_attendance_pages(self):
+        other = Baby.objects.create(name='Иван', gender=Baby.GENDER_MALE, birthday='2010-10-02')
+        for day in range(3):
+            for baby in (self.baby, other):
+                Journal.objects.create(
+                    baby=baby, income_time=self.income_time + timedelta(days=day), income_escort=Journal.ESCORT_FATHER,
+                    outcome_time=self.outcome_time + timedelta(days=day), outcome_escort=Journal.ESCORT_MOTHER,
+                )
+        DailyAttendance.refresh({
+            (baby_id, DailyAttendance.visit_date(income_time))
+            for baby_id, income_time in Journal.objects.values_list('baby_id', 'income_time')
+        })
+        expected = list(DailyAttendance.objects.order_by('date', 'baby_id').values_list('date', 'baby_id'))
+
+        keys, url, params = [], self.URL_ATTENDANCE_LIST, {'page_size': 4}
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url, params).json()
+            keys.extend((date.fromisoformat(item['date']), item['baby']) for item in data['results'])
+            url, params = data['next'], None
+        self.assertListEqual(keys, expected)
+
+        # назад от второй страницы
+        previous = self.client.get(self.client.get(self.URL_ATTENDANCE_LIST, {'page_size': 4}).json()['next']).json()
+        self.assertEqual(len(self.client.get(previous['previous']).json()['results']), 4)
+
+
+class JournalExportTests(APITestCase):
+    URL_JOURNAL_EXPORT = reverse('journal-export')
+
+    def setUp(self):
+        self.baby = Baby.objects.create(name='Петр', gender=Baby.GENDER_MALE, birthday='2010-10-01', is_study=True)
+        self.other = Baby.objects.create(name='Иван', gender=Baby.GENDER_MALE, birthday='2010-10-02')
+        self.income_time = datetime(2010, 2, 1, 8, 0, 0, tzinfo=pytz.utc)
+
+        self.records = [
+            Journal.objects.create(
+                baby=baby, income_time=self.income_time + timedelta(days=i), income_escort=Journal.ESCORT_FATHER,
+                outcome_time=self.income_time + timedelta(days=i, hours=8), outcome_escort=Journal.ESCORT_MOTHER,
+            )
+            for i, baby in enumerate((self.baby, self.other, self.baby))
+        ]
+
+    def get_export(self, params):
+        response = self.client.get(self.URL_JOURNAL_EXPORT, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        content = self.get_export({'type': 'ndjson', 'date_from': '2010-02-02'})
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        serialized = self.client.get(reverse('journal-detail', kwargs={'pk': self.records[1].pk})).json()
+        self.assertEqual(len(rows), 2)
+        self.assertDictEqual(serialized, rows[0])
+
+    def test_export_csv(self):
+        content = self.get_export({'is_study': 'true', 'date_to': '2010-02-02'})
+
+        rows = list(csv.reader(StringIO(content)))
+        self.assertListEqual(list(export.FIELDS), rows[0])
+        self.assertListEqual([str(self.records[0].id)], [row[0] for row in rows[1:]])
+
+    def test_export_command(self):
+        stdout = StringIO()
+        call_command('export_journal', format='ndjson', is_study='true', chunk_size=1, stdout=stdout)
+
+        ids = [json.loads(line)['id'] for line in stdout.getvalue().splitlines()]
+        self.assertListEqual([self.records[0].id, self.records[2].id], ids)
+
+
+class JournalFilterTests(APITestCase):
+    URL_JOURNAL_LIST = reverse('journal-list')
+
+    def setUp(self):
+        self.babies = [
+            Baby.objects.create(name='Name%d' % i, gender=Baby.GENDER_MALE, birthday='2010-10-01', grade=i % 2)
+            for i in range(3)
+        ]
+        self.income_time = datetime(2010, 2, 1, 8, 0, 0, tzinfo=pytz.utc)
+
+        self.records = {}
+        for day in range(3):
+            for baby in self.babies:
+                self.records[baby.id, day] = Journal.objects.create(
+                    baby=baby,
+                    income_time=self.income_time + timedelta(days=day),
+                    income_escort=day % 2,
+                    outcome_time=self.income_time + timedelta(days=day, hours=8),
+                    outcome_escort=Journal.ESCORT_MOTHER,
+                )
+
+    def get_ids(self, params):
+        response = self.client.get(self.URL_JOURNAL_LIST, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {record['id'] for record in response.json()['results']}
+
+    def test_filter_baby_and_dates(self):
+        baby = self.babies[1]
+        ids = self.get_ids({'baby': baby.id, 'date_from': '2010-02-02', 'date_to': '2010-02-03'})
+
+        self.assertSetEqual({self.records[baby.id, 1].id, self.records[baby.id, 2].id}, ids)
+
+    def test_filter_grade_and_escort(self):
+        ids = self.get_ids({'grade': 1, 'income_escort': Journal.ESCORT_MOTHER})
+
+        self.assertSetEqual({self.records[self.babies[1].id, 1].id}, ids)
+
+    def test_filter_invalid(self):
+        for params in ({'baby': 'x'}, {'date_from': '2010-13-01'}, {'income_escort': 5}):
+            response = self.client.get(self.URL_JOURNAL_LIST, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked on SQLite')
+class JournalQueryPlanTests(TestCase):
+
+    def get_index_name(self, model, fields):
+        return next(index.name for index in model._meta.indexes if index.fields == fields)
+
+    def filter(self, params):
+        request = Request(APIRequestFactory().get('/', params))
+        queryset = JournalFilterBackend().filter_queryset(request, Journal.objects.all(), None)
+        # порядок страницы, как у JournalCursorPagination
+        return queryset.filter(income_time__isnull=False).order_by('income_time', 'id')
+
+    def test_baby_week(self):
+        plan = self.filter({'baby': 1, 'date_from': '2010-02-01', 'date_to': '2010-02-07'}).explain()
+
+        self.assertIn(self.get_index_name(Journal, ['baby', 'income_time']), plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_week(self):
+        plan = self.filter({'date_from': '2010-02-01', 'date_to': '2010-02-07'}).explain()
+
+        self.assertIn(self.get_index_name(Journal, ['income_time', 'id']), plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_is_study(self):
+        plan = Baby.objects.filter(is_study=True).explain()
+
+        self.assertRegex(plan, r'USING (COVERING )?INDEX \w*is_study')
+
+
+class APIBabyCacheTests(APITestCase):
+    URL_BABY_LIST = reverse('baby-list')
+
+    def setUp(self):
+        cache.clear()
+        self.baby = Baby.objects.create(name='Иван', gender=Baby.GENDER_MALE, birthday='2000-01-01')
+
+    def test_not_modified(self):
+        response = self.client.get(self.URL_BABY_LIST)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.URL_BABY_LIST, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.URL_BABY_LIST, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cached_until_write(self):
+        url_baby_detail = reverse('baby-detail', kwargs={'pk': self.baby.pk})
+        self.client.get(self.URL_BABY_LIST)
+        etag = self.client.get(url_baby_detail)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url_baby_detail)
+        self.assertEqual(response.json()['name'], self.baby.name)
+
+        response = self.client.patch(url_baby_detail, {'name': 'Петр'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(url_baby_detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(etag, response['ETag'])
+        self.assertEqual(response.json()['name'], 'Петр')
+        self.assertListEqual(['Петр'], [baby['name'] for baby in self.client.get(self.URL_BABY_LIST).json()])
+
+    def test_write_outside_viewset(self):
+        etag = self.client.get(self.URL_BABY_LIST)['ETag']
+
+        self.baby.name = 'Петр'
+        self.baby.save()
+        response = self.client.get(self.URL_BABY_LIST, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(['Петр'], [baby['name'] for baby in response.json()])
+
+        etag = response['ETag']
+        self.baby.delete()
+        response = self.client.get(self.URL_BABY_LIST, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([], response.json())
+
+
+class RowSerializerTests(TestCase):
+
+    def setUp(self):
+        self.babies = [
+            Baby.objects.create(name='Иван', gender=Baby.GENDER_MALE, birthday='2000-01-01'),
+            Baby.objects.create(name='Мария', gender=Baby.GENDER_FEMALE, birthday='2001-02-03',
+                                photo='/path/to/image.jpeg', grade=2, is_study=True),
+        ]
+        income_time = datetime(2010, 2, 1, 8, 20, 15, 123456, tzinfo=pytz.utc)
+        Journal.objects.create(baby=self.babies[0])
+        Journal.objects.create(
+            baby=self.babies[1],
+            income_time=income_time, income_escort=Journal.ESCORT_MOTHER,
+            outcome_time=income_time + timedelta(hours=8), outcome_escort=Journal.ESCORT_FATHER,
+        )
+
+    def assertSameJSON(self, serializer_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+        rows = RowSerializer(serializer_class())
+        self.assertTrue(rows.supported)
+        self.assertEqual(expected, JSONRenderer().render(rows.serialize(rows.get_queryset(queryset))))
+
+    def test_baby(self):
+        self.assertSameJSON(BabySerializer, Baby.objects.order_by('id'))
+
+    def test_journal(self):
+        self.assertSameJSON(JournalSerializer, Journal.objects.order_by('id'))
+
+    def test_unsupported_field(self):
+        class Serializer(BabySerializer):
+            age = serializers.SerializerMethodField()
+
+            class Meta(BabySerializer.Meta):
+                fields = BabySerializer.Meta.fields + ('age',)
+
+        self.assertFalse(RowSerializer(Serializer()).supported)
+
+
+class SparseFieldsTests(APITestCase):
+    URL_BABY_LIST = reverse('baby-list')
+    URL_JOURNAL_LIST = reverse('journal-list')
+
+    def setUp(self):
+        cache.clear()
+        self.baby = Baby.objects.create(name='Иван', gender=Baby.GENDER_MALE, birthday='2000-01-01', is_study=True)
+        self.income_time = datetime(2010, 2, 1, 8, 0, 0, tzinfo=pytz.utc)
+        for i in range(3):
+            Journal.objects.create(
+                baby=self.baby,
+                income_time=self.income_time + timedelta(days=i), income_escort=Journal.ESCORT_FATHER,
+                outcome_time=self.income_time + timedelta(days=i, hours=8), outcome_escort=Journal.ESCORT_MOTHER,
+            )
+
+    def test_baby_list(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.URL_BABY_LIST, {'fields': 'id,name,is_study'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([{'id': self.baby.id, 'name': 'Иван', 'is_study': True}], response.json())
+        self.assertNotIn('birthday', queries[-1]['sql'])
+
+    def test_baby_detail(self):
+        url_baby_detail = reverse('baby-detail', kwargs={'pk': self.baby.pk})
+        response = self.client.get(url_baby_detail, {'fields': 'name'})
+
+        self.assertDictEqual({'name': 'Иван'}, response.json())
+
+    def test_journal_pages(self):
+        ids, url, params = [], self.URL_JOURNAL_LIST, {'fields': 'baby', 'page_size': 1}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            for record in response.json()['results']:
+                self.assertDictEqual({'baby': self.baby.id}, record)
+                ids.append(record)
+            url, params = response.json()['next'], None
+
+        self.assertEqual(len(ids), 3)
+
+    def test_study_list(self):
+        response = self.client.get(reverse('journal-study'), {'fields': 'baby,income_time'})
+
+        self.assertSetEqual({'baby', 'income_time'}, set(response.json()['results'][0]))
+
+    def test_unknown_field(self):
+        response = self.client.get(self.URL_BABY_LIST, {'fields': 'id,secret'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_write_ignores_fields(self):
+        url_baby_detail = reverse('baby-detail', kwargs={'pk': self.baby.pk})
+        response = self.client.patch(url_baby_detail + '?fields=id', {'name': 'Петр'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['name'], 'Петр')
+
+
+class MetricsTests(APITestCase):
+    URL_BABY_LIST = reverse('baby-list')
+    URL_METRICS = reverse('metrics')
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        Baby.objects.create(name='Иван', gender=Baby.GENDER_MALE, birthday='2000-01-01')
+
+    def test_metrics(self):
+        self.client.get(self.URL_BABY_LIST)
+        response = self.client.get(self.URL_METRICS)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content.decode()
+        labels = 'view="baby-list",method="GET",code="200"'
+        self.assertIn('manger_http_request_duration_seconds_count{%s} 1' % labels, content)
+        self.assertIn('manger_http_response_size_bytes_count{%s} 1' % labels, content)
+        self.assertIn('manger_db_queries_sum{%s} 1.0' % labels, content)
+        self.assertIn('manger_db_queries_bucket{%s,le="+Inf"} 1' % labels, content)
+
+    @override_settings(MANGER_METRICS_SAMPLE_RATE=0)
+    def test_sampling(self):
+        self.client.get(self.URL_BABY_LIST)
+        content = self.client.get(self.URL_METRICS).content.decode()
+
+        self.assertIn('manger_http_request_duration_seconds_count{view="baby-list"', content)
+        self.assertNotIn('manger_db_queries_count{view="baby-list"', content)
+
+    def test_internal_only(self):
+        response = self.client.get(self.URL_METRICS, REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Каждый маршрут из manger.bench.ROUTES укладывается в свой лимит запросов
+    на данных, где N+1 уже был бы заметен.
+    """
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            MANGER_INGEST_QUEUE=os.path.join(directory.name, 'ingest.sqlite3'), MANGER_INGEST_THREAD=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        bench.seed(babies=10, journal=50)
+        DailyAttendance.refresh({
+            (baby_id, DailyAttendance.visit_date(income_time))
+            for baby_id, income_time in Journal.objects.values_list('baby_id', 'income_time')
+        })
+        self.data = bench.Dataset()
+
+    def test_query_budgets(self):
+        for route in bench.ROUTES:
+            with self.subTest(route=route.name):
+                result = bench.run_route(self.client, route, self.data, requests=2)
+
+                self.assertEqual(result.errors, 0)
+                self.assertLessEqual(result.queries, route.max_queries)
+
+
+class ImportCommandsTests(TestCase):
+
+    def write(self, content, suffix):
+        file = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        with file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def import_babies(self):
+        babies = self.write(
+            'id,name,gender,birthday,grade,is_study\n'
+            'a1,Иван,0,2010-01-01,,false\n'
+            'a2,Мария,1,2011-02-03,2,true\n',
+            '.csv',
+        )
+        id_map = self.write('', '.csv')
+        call_command('import_babies', babies, id_map_output=id_map, stdout=StringIO())
+        return id_map
+
+    def test_import(self):
+        id_map = self.import_babies()
+        journal = self.write(
+            '{"baby": "a1", "income_time": "2010-02-01 08:00:00", "income_escort": 0, '
+            '"outcome_time": "2010-02-01 17:00:00", "outcome_escort": 1}\n'
+            '\n'
+            '{"baby": "a2", "income_time": "2010-02-01T08:30:00+03:00", "income_escort": 1}\n',
+            '.ndjson',
+        )
+        call_command('import_journal', journal, id_map=id_map, batch_size=1, stdout=StringIO())
+
+        ivan, maria = Baby.objects.get(name='Иван'), Baby.objects.get(name='Мария')
+        self.assertIsNone(ivan.grade)
+        self.assertTrue(maria.is_study)
+
+        record = Journal.objects.get(baby=ivan)
+        self.assertEqual(record.income_time, datetime(2010, 2, 1, 8, 0, tzinfo=pytz.utc))
+        self.assertEqual(record.outcome_escort, Journal.ESCORT_MOTHER)
+        self.assertEqual(Journal.objects.get(baby=maria).income_time, datetime(2010, 2, 1, 5, 30, tzinfo=pytz.utc))
+        self.assertEqual(DailyAttendance.objects.count(), 2)
+
+    def test_invalid_rows(self):
+        id_map = self.import_babies()
+        journal = self.write(
+            'baby,income_time,income_escort,outcome_time,outcome_escort\n'
+            'a1,2010-02-01 08:00:00,0,,\n'
+            # нет сопровождающего
+            'a2,2010-02-01 08:00:00,,,\n'
+            # неизвестный ребенок
+            'a3,2010-02-01 08:00:00,0,,\n',
+            '.csv',
+        )
+        stderr = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('import_journal', journal, id_map=id_map, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(Journal.objects.count(), 0)
+        self.assertIn('line 3', stderr.getvalue())
+        self.assertIn('line 4', stderr.getvalue())
+
+        call_command('import_journal', journal, id_map=id_map, skip_invalid=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Journal.objects.count(), 1)
+
+    def test_resume(self):
+        id_map = self.import_babies()
+        journal = self.write(
+            'baby,income_time,income_escort,outcome_time,outcome_escort\n'
+            'a1,2010-02-01 08:00:00,0,2010-02-01 09:00:00,1\n'
+            'a2,2010-02-01 08:00:00,0,2010-02-01 09:00:00,1\n'
+            'a1,2010-02-02 08:00:00,0,2010-02-02 09:00:00,1\n'
+            'a3,2010-02-02 08:00:00,0,,\n',
+            '.csv',
+        )
+        # пачки до ошибочной строки уже записаны
+        with self.assertRaises(CommandError):
+            call_command('import_journal', journal, id_map=id_map, batch_size=1, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Journal.objects.count(), 3)
+
+        # повторный запуск не дублирует записанное
+        call_command(
+            'import_journal', journal, id_map=id_map, batch_size=1, workers=2, skip_invalid=True,
+            stdout=StringIO(), stderr=StringIO(),
+        )
+        self.assertEqual(Journal.objects.count(), 3)
+        self.assertEqual(DailyAttendance.objects.count(), 3)
+
+
+class FeedTests(TransactionTestCase):
+    URL_FEED = reverse('feed')
+    URL_JOURNAL = reverse('journal-list')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.baby = Baby.objects.create(name='Name', gender=Baby.GENDER_MALE, birthday='2010-10-01')
+        self.income_time = datetime(2010, 2, 1, 8, 30, 0, tzinfo=pytz.utc)
+        self.since = feed.broker.format_id(feed.broker.seq)
+
+    def poll(self, since=None):
+        response = self.client.get(self.URL_FEED, {'since': since or self.since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_journal_events(self):
+        data = {'baby': self.baby.id, 'income_time': str(self.income_time), 'income_escort': Journal.ESCORT_MOTHER}
+        record_id = self.client.post(self.URL_JOURNAL, data, format='json').json()['id']
+        self.client.delete(reverse('journal-detail', args=[record_id]))
+
+        events = self.poll()['events']
+        self.assertListEqual(
+            [('created', 'journal', record_id), ('deleted', 'journal', record_id)],
+            [(event['type'], event['model'], event['pk']) for event in events],
+        )
+        self.assertEqual(events[0]['data']['baby'], self.baby.id)
+
+    def test_resume(self):
+        self.baby.save()
+        response = self.poll()
+        self.assertEqual(len(response['events']), 1)
+
+        # продолжение с последнего события: новых нет
+        self.assertListEqual(self.poll(response['last'])['events'], [])
+        # другая эпоха (перезапуск процесса) требует полной перезагрузки
+        self.assertEqual(self.poll('other:1')['events'][0]['type'], 'reset')
+
+    def test_rollback(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.baby.save()
+            raise RuntimeError
+        self.assertListEqual(self.poll()['events'], [])
+
+    def test_bulk(self):
+        data = [{'baby': self.baby.id, 'income_time': str(self.income_time), 'income_escort': Journal.ESCORT_MOTHER}]
+        self.client.post(reverse('journal-bulk'), data, format='json')
+
+        events = self.poll()['events']
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['type'], 'created')
+        self.assertEqual(events[0]['pk'], Journal.objects.get().pk)
+        self.assertEqual(events[0]['data']['id'], Journal.objects.get().pk)
+
+    def test_stream(self):
+        self.baby.save()
+        response = self.client.get(reverse('feed-stream'), HTTP_LAST_EVENT_ID=self.since)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        stream = iter(response.streaming_content)
+        self.assertEqual(next(stream), b'retry: 1000\n\n')
+        chunk = next(stream).decode()
+        response.close()
+
+        self.assertTrue(chunk.startswith('id: %s\nevent: updated\n' % feed.broker.format_id(feed.broker.seq)))
+        self.assertEqual(json.loads(chunk.split('data: ', 1)[1])['data']['name'], 'Name')
+
+
+class SyncTests(APITestCase):
+    URL_SYNC = reverse('sync')
+
+    def setUp(self):
+        self.babies = [
+            Baby.objects.create(name='Name%d' % i, gender=Baby.GENDER_MALE, birthday='2010-10-01')
+            for i in range(2)
+        ]
+        self.record = Journal.objects.create(
+            baby=self.babies[0], income_time=datetime(2010, 2, 1, 8, 30, 0, tzinfo=pytz.utc),
+            income_escort=Journal.ESCORT_MOTHER,
+        )
+
+    def sync(self, since=0, **params):
+        response = self.client.get(self.URL_SYNC, {'since': since, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_full_sync(self):
+        data = self.sync()
+        self.assertFalse(data['more'])
+        self.assertEqual(data['version'], self.record.version)
+        self.assertListEqual([baby['id'] for baby in data['babies']], [baby.id for baby in self.babies])
+        self.assertListEqual(data['journal'], [JournalSerializer(self.record).data])
+
+    def test_changes_since(self):
+        version = self.sync()['version']
+        baby = self.babies[1]
+        baby.name = 'Renamed'
+        baby.save()
+        # каскадное удаление оставляет надгробие и для записи журнала
+        deleted_id = self.babies[0].id
+        self.babies[0].delete()
+
+        with self.assertNumQueries(4):
+            data = self.sync(version)
+        self.assertListEqual([(item['id'], item['name']) for item in data['babies']], [(baby.id, 'Renamed')])
+        self.assertListEqual(data['journal'], [])
+        self.assertDictEqual(data['deleted'], {'baby': [deleted_id], 'journal': [self.record.id]})
+        self.assertListEqual(self.sync(data['version'])['babies'], [])
+
+    def test_paging(self):
+        data = self.sync(limit=2)
+        self.assertTrue(data['more'])
+        self.assertEqual(len(data['babies']), 2)
+
+        data = self.sync(data['version'], limit=2)
+        self.assertFalse(data['more'])
+        self.assertEqual(data['journal'][0]['id'], self.record.id)
+
+    def test_pruned(self):
+        version = self.sync()['version']
+        self.record.delete()
+        call_command('prune_tombstones', days=-1, stdout=StringIO())
+
+        self.assertTrue(self.sync(version)['reset'])
+        self.assertFalse(self.sync()['reset'])
+
+
+class IngestQueueTests(APITestCase):
+    URL_QUEUE = reverse('journal-queue')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            MANGER_INGEST_QUEUE=os.path.join(directory.name, 'ingest.sqlite3'), MANGER_INGEST_THREAD=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.baby = Baby.objects.create(name='Name', gender=Baby.GENDER_MALE, birthday='2010-10-01')
+        self.income_time = datetime(2010, 2, 1, 8, 30, 0, tzinfo=pytz.utc)
+        self.data = {'baby': self.baby.id, 'income_time': str(self.income_time), 'income_escort': Journal.ESCORT_MOTHER}
+
+    def enqueue(self, data):
+        response = self.client.post(self.URL_QUEUE, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return response
+
+    def test_read_back(self):
+        response = self.enqueue(self.data)
+        self.assertEqual(Journal.objects.count(), 0)
+        self.assertEqual(self.client.get(response['Location']).json()['status'], 'pending')
+
+        self.assertEqual(ingest.drain(ingest.get_queue(), batch_size=10), 1)
+
+        data = self.client.get(response['Location']).json()
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual(data['record']['id'], Journal.objects.get().id)
+        self.assertEqual(data['record']['income_time'], '2010-02-01T08:30:00Z')
+
+    def test_invalid(self):
+        response = self.client.post(self.URL_QUEUE, {**self.data, 'income_escort': None}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_failed_on_apply(self):
+        # обе записи проверены при приеме, но второе открытое посещение не допускается
+        first, second = self.enqueue(self.data), self.enqueue({**self.data, 'income_escort': Journal.ESCORT_FATHER})
+        ingest.drain(ingest.get_queue(), batch_size=10)
+
+        self.assertEqual(self.client.get(first['Location']).json()['status'], 'done')
+        data = self.client.get(second['Location']).json()
+        self.assertEqual(data['status'], 'failed')
+        self.assertListEqual(data['errors'], [JournalSerializer.OPEN_VISIT_EXISTS_MESSAGE])
+        self.assertEqual(Journal.objects.count(), 1)
+
+    def test_checkout(self):
+        record = Journal.objects.create(baby=self.baby, income_time=self.income_time, income_escort=0)
+        self.enqueue({'id': record.id, 'outcome_time': str(self.income_time + timedelta(hours=8)), 'outcome_escort': 1})
+        ingest.drain(ingest.get_queue(), batch_size=10)
+
+        record.refresh_from_db()
+        self.assertEqual(record.outcome_escort, 1)
+        self.assertEqual(DailyAttendance.objects.get().minutes, 480)
+
+    def test_updates_keep_earlier_changes(self):
+        record = Journal.objects.create(baby=self.baby, income_time=self.income_time, income_escort=0)
+        # каждое обновление содержит только свои поля, а не снимок записи на момент приема
+        self.enqueue({'id': record.id, 'income_escort': 1})
+        self.enqueue({'id': record.id, 'outcome_time': str(self.income_time + timedelta(hours=8)), 'outcome_escort': 1})
+        ingest.drain(ingest.get_queue(), batch_size=10)
+
+        record.refresh_from_db()
+        self.assertEqual(record.income_escort, 1)
+        self.assertEqual(record.outcome_escort, 1)
+        self.assertEqual(record.outcome_time, self.income_time + timedelta(hours=8))
+
+    def test_replay_after_crash(self):
+        self.enqueue(self.data)
+        queue = ingest.get_queue()
+        # запись применена, но отметить ее в очереди процесс не успел
+        ingest.apply(queue.pending(10))
+
+        reopened = ingest.IngestQueue(queue.path)
+        self.assertEqual(len(reopened.pending(10)), 1)
+        ingest.drain(reopened, batch_size=10)
+        self.assertListEqual(reopened.pending(10), [])
+        self.assertEqual(Journal.objects.count(), 1)
+
+
+class DatabaseConfigTests(TestCase):
+    def test_sqlite_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], dict(settings.MANGER_SQLITE_PRAGMAS)['cache_size'])
+
+    @override_settings(MANGER_DB_REPLICA='replica')
+    def test_replica_router(self):
+        replica_router = ReplicaRouter()
+        self.assertIsNone(replica_router.db_for_read(Journal))
+        with replica_reads():
+            self.assertEqual(replica_router.db_for_read(Journal), 'replica')
+            self.assertIsNone(replica_router.db_for_write(Journal))
+        self.assertFalse(replica_router.allow_migrate('replica', 'manger'))
+        self.assertIsNone(replica_router.allow_migrate('default', 'manger'))
+
+    @override_settings(MANGER_DB_REPLICA='replica')
+    def test_list_reads_replica(self):
+        aliases = []
+
+        class Router(ReplicaRouter):
+            def db_for_read(self, model, **hints):
+                aliases.append(super().db_for_read(model, **hints))
+
+        with mock.patch.dict(router.__dict__, {'routers': [Router()]}):
+            self.client.get(reverse('journal-list'))
+            self.assertSetEqual(set(aliases), {'replica'})
+            # присутствующие нужны без отставания реплики
+            aliases.clear()
+            self.client.get(reverse('journal-present'))
+            self.assertSetEqual(set(aliases), {None})
+
+
+class JournalArchiveTests(APITestCase):
+    URL_JOURNAL = reverse('journal-list')
+
+    def setUp(self):
+        babies = [
+            Baby.objects.create(name='Name%d' % i, gender=Baby.GENDER_MALE, birthday='2010-10-01', is_study=i == 0)
+            for i in range(2)
+        ]
+        now = datetime.now(pytz.utc).replace(microsecond=0)
+        for baby in babies:
+            for days in (900, 600, 3):
+                income_time = now - timedelta(days=days, hours=baby.id)
+                Journal.objects.create(
+                    baby=baby, income_time=income_time, income_escort=0,
+                    outcome_time=income_time + timedelta(hours=8), outcome_escort=1,
+                )
+            Journal.objects.create(baby=baby, income_time=now, income_escort=0)
+
+    def archive(self):
+        call_command('archive_journal', days=365, batch_size=3, stdout=StringIO())
+
+    def get_all(self, url, **params):
+        results, response = [], self.client.get(url, {'page_size': 3, **params}).json()
+        while True:
+            results.extend(response['results'])
+            if response['next'] is None:
+                return results
+            response = self.client.get(response['next']).json()
+
+    def test_archive(self):
+        ids = set(Journal.objects.values_list('id', flat=True))
+        self.archive()
+
+        self.assertEqual(JournalArchive.objects.count(), 4)
+        self.assertEqual(Journal.objects.count(), 4)
+        archived = set(JournalArchive.objects.values_list('id', flat=True))
+        self.assertSetEqual(archived | set(Journal.objects.values_list('id', flat=True)), ids)
+        # повторный запуск ничего не переносит
+        self.archive()
+        self.assertEqual(JournalArchive.objects.count(), 4)
+
+    def test_list(self):
+        expected = self.get_all(self.URL_JOURNAL)
+        study = self.get_all(reverse('journal-study'))
+        self.archive()
+
+        self.assertEqual(len(self.get_all(self.URL_JOURNAL)), 4)
+        self.assertListEqual(self.get_all(self.URL_JOURNAL, archive='true'), expected)
+        self.assertListEqual(self.get_all(reverse('journal-study'), archive='true'), study)
+
+        # обратный проход по ссылкам previous
+        response = self.client.get(self.URL_JOURNAL, {'page_size': 5, 'archive': 'true'}).json()
+        response = self.client.get(self.client.get(response['next']).json()['previous']).json()
+        self.assertListEqual(response['results'], expected[:5])
+
+    def test_export(self):
+        url = reverse('journal-export')
+        expected = b''.join(self.client.get(url).streaming_content)
+        self.archive()
+
+        self.assertEqual(b''.join(self.client.get(url, {'archive': 'true'}).streaming_content), expected)
+        self.assertNotEqual(b''.join(self.client.get(url).streaming_content), expected)
+
+    def test_rebuild_attendance(self):
+        call_command('rebuild_attendance', stdout=StringIO())
+        expected = list(DailyAttendance.objects.order_by('baby', 'date').values())
+        self.archive()
+        call_command('rebuild_attendance', stdout=StringIO())
+
+        self.assertEqual(
+            [dict(row, id=None) for row in DailyAttendance.objects.order_by('baby', 'date').values()],
+            [dict(row, id=None) for row in expected],
+        )
+
+    def test_refresh_attendance(self):
+        self.archive()
+        record = JournalArchive.objects.order_by('id').first()
+        # второе посещение в тот же архивный день осталось в журнале
+        Journal.objects.create(
+            baby=record.baby, income_time=record.income_time + timedelta(minutes=1), income_escort=0,
+            outcome_time=record.income_time + timedelta(minutes=2), outcome_escort=0,
+        )
+        DailyAttendance.refresh(DailyAttendance.keys_for(record))
+        self.assertEqual(DailyAttendance.objects.get(baby=record.baby).visits, 2)
+
+
+class AnalyticsTests(APITestCase):
+    URL_ANALYTICS = reverse('analytics')
+
+    def setUp(self):
+        cache.clear()
+        first = Baby.objects.create(name='Name1', gender=Baby.GENDER_MALE, birthday='2010-10-01', grade=1)
+        second = Baby.objects.create(name='Name2', gender=Baby.GENDER_MALE, birthday='2010-10-01')
+        day = datetime(2010, 2, 1, tzinfo=pytz.utc)
+        for baby, start, hours in ((first, 8, 8), (second, 9, 2)):
+            Journal.objects.create(
+                baby=baby, income_time=day + timedelta(hours=start), income_escort=Journal.ESCORT_MOTHER,
+                outcome_time=day + timedelta(hours=start + hours), outcome_escort=Journal.ESCORT_MOTHER,
+            )
+        Journal.objects.create(
+            baby=first, income_time=day + timedelta(days=1, hours=8, minutes=10), income_escort=Journal.ESCORT_FATHER,
+            outcome_time=day + timedelta(days=1, hours=8, minutes=40), outcome_escort=Journal.ESCORT_MOTHER,
+        )
+
+    def get(self, **params):
+        return self.client.get(self.URL_ANALYTICS, {'date_from': '2010-02-01', 'date_to': '2010-02-03', **params})
+
+    def test_analytics(self):
+        data = self.get().json()
+        self.assertEqual(data['visits'], 3)
+        self.assertEqual(data['days'], 2)
+
+        occupancy = {slot['time']: slot for slot in data['occupancy']}
+        self.assertEqual(len(occupancy), 96)
+        self.assertDictEqual(occupancy['09:30'], {'time': '09:30', 'average': 1.0, 'max': 2})
+        # 8:10-8:40 занимает слоты 8:00, 8:15 и 8:30
+        self.assertDictEqual(occupancy['08:30'], {'time': '08:30', 'average': 1.0, 'max': 1})
+        self.assertDictEqual(occupancy['16:00'], {'time': '16:00', 'average': 0.0, 'max': 0})
+
+        self.assertListEqual(data['stay_by_grade'], [
+            {'grade': None, 'visits': 1, 'average_minutes': 120.0},
+            {'grade': 1, 'visits': 2, 'average_minutes': 255.0},
+        ])
+        self.assertListEqual(data['arrivals_by_escort'], [
+            {'income_escort': Journal.ESCORT_FATHER, 'count': 1},
+            {'income_escort': Journal.ESCORT_MOTHER, 'count': 2},
+        ])
+
+    def test_negative_and_null_grades(self):
+        day = datetime(2010, 2, 1, tzinfo=pytz.utc)
+        for grade in (-3, -1, None):
+            baby = Baby.objects.create(name='Grade%s' % grade, gender=Baby.GENDER_MALE, birthday='2010-10-01', grade=grade)
+            Journal.objects.create(
+                baby=baby, income_time=day + timedelta(hours=10), income_escort=Journal.ESCORT_MOTHER,
+                outcome_time=day + timedelta(hours=11), outcome_escort=Journal.ESCORT_MOTHER,
+            )
+
+        response = self.get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(response.json()['stay_by_grade'], [
+            {'grade': None, 'visits': 2, 'average_minutes': 90.0},
+            {'grade': -3, 'visits': 1, 'average_minutes': 60.0},
+            {'grade': -1, 'visits': 1, 'average_minutes': 60.0},
+            {'grade': 1, 'visits': 2, 'average_minutes': 255.0},
+        ])
+
+    def test_cache(self):
+        self.get()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get().json()['visits'], 3)
+
+        # запись в журнал меняет версию данных и ключ кеша
+        record = Journal.objects.first()
+        record.income_escort = Journal.ESCORT_FATHER
+        record.save()
+        self.assertEqual(self.get().json()['arrivals_by_escort'][0]['count'], 2)
+
+    def test_archive_cutoff(self):
+        # посещение из дня, в котором проходит граница архивации, уже в архиве
+        cutoff = datetime.now(pytz.utc).replace(microsecond=0) - timedelta(days=settings.MANGER_ARCHIVE_AFTER_DAYS)
+        day = DailyAttendance.visit_date(cutoff - timedelta(minutes=2))
+        income_time = DailyAttendance.day_start(day)
+        Journal.objects.create(
+            baby=Baby.objects.first(), income_time=income_time, income_escort=Journal.ESCORT_MOTHER,
+            outcome_time=income_time + timedelta(seconds=1), outcome_escort=Journal.ESCORT_MOTHER,
+        )
+        call_command('archive_journal', stdout=StringIO())
+
+        data = self.get(date_from=day.isoformat(), date_to=day.isoformat()).json()
+        self.assertEqual(data['visits'], 1)
+
+    def test_invalid_range(self):
+        self.assertEqual(self.get(date_to='2010-01-01').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.URL_ANALYTICS).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ResponseFormatTests(APITestCase):
+    URL_JOURNAL_LIST = reverse('journal-list')
+
+    def setUp(self):
+        cache.clear()
+        self.baby = Baby.objects.create(name='Петр', gender=Baby.GENDER_MALE, birthday='2010-10-01')
+        income_time = datetime(2010, 2, 1, 8, 0, 0, tzinfo=pytz.utc)
+        for i in range(30):
+            Journal.objects.create(
+                baby=self.baby, income_time=income_time + timedelta(days=i), income_escort=Journal.ESCORT_FATHER,
+                outcome_time=income_time + timedelta(days=i, hours=8), outcome_escort=Journal.ESCORT_MOTHER,
+            )
+
+    def test_msgpack(self):
+        expected = self.client.get(self.URL_JOURNAL_LIST).json()
+
+        response = self.client.get(self.URL_JOURNAL_LIST, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertDictEqual(expected, msgpack.unpackb(response.content))
+
+    def test_columns(self):
+        expected = self.client.get(self.URL_JOURNAL_LIST).json()
+
+        for media_type, decode in (('application/json', json.loads), ('application/msgpack', msgpack.unpackb)):
+            response = self.client.get(self.URL_JOURNAL_LIST, HTTP_ACCEPT=media_type + '; layout=columns')
+            data = decode(response.content)
+            self.assertEqual(data['next'], expected['next'])
+            self.assertListEqual(data['results']['id'], [row['id'] for row in expected['results']])
+            self.assertListEqual(data['results']['income_time'], [row['income_time'] for row in expected['results']])
+
+        # одна запись не меняется
+        url = reverse('baby-detail', args=[self.baby.pk])
+        response = self.client.get(url, HTTP_ACCEPT='application/json; layout=columns')
+        self.assertEqual(response.json()['name'], 'Петр')
+
+    def test_unknown_layout(self):
+        expected = self.client.get(self.URL_JOURNAL_LIST).json()
+        for layout in ('café', '"columns"x', ''):
+            response = self.client.get(self.URL_JOURNAL_LIST, HTTP_ACCEPT='application/json; layout=%s' % layout)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, layout)
+            self.assertDictEqual(response.json(), expected)
+
+    def test_gzip(self):
+        expected = self.client.get(self.URL_JOURNAL_LIST).content
+
+        with mock.patch('manger.api.compression.brotli', None):
+            response = self.client.get(self.URL_JOURNAL_LIST, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), expected)
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli(self):
+        expected = self.client.get(self.URL_JOURNAL_LIST).content
+
+        response = self.client.get(self.URL_JOURNAL_LIST, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), expected)
+
+        response = self.client.get(self.URL_JOURNAL_LIST, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_small_response(self):
+        url = reverse('baby-detail', args=[self.baby.pk])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.json()['name'], 'Петр')
+
+    def test_streaming(self):
+        response = self.client.get(reverse('journal-export'), {'type': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(len(content.splitlines()), 30)
+
+    def test_measure_formats(self):
+        route = next(route for route in bench.ROUTES if route.name == 'journal-list')
+        results = bench.measure_formats(self.client, route, bench.Dataset(), 1)
+
+        sizes = {result.name: result.size for result in results}
+        self.assertSetEqual(set(sizes), {name for name, _, _ in bench.FORMATS})
+        self.assertLess(sizes['msgpack-columns'], sizes['json'])
+
+
+class ThumbnailTests(APITestCase):
+
+    def setUp(self):
+        self.photos = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.photos.cleanup)
+        self.addCleanup(self.cache_dir.cleanup)
+        self.addCleanup(self.shutdown_pool)
+
+        os.makedirs(os.path.join(self.photos.name, 'babies'))
+        Image.new('RGB', (800, 600), (200, 10, 10)).save(os.path.join(self.photos.name, 'babies', 'petr.jpg'))
+        self.baby = Baby.objects.create(
+            name='Петр', gender=Baby.GENDER_MALE, birthday='2010-10-01', photo='/babies/petr.jpg',
+        )
+
+        overrides = override_settings(MANGER_PHOTO_ROOT=self.photos.name, MANGER_THUMBNAIL_CACHE=self.cache_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    @staticmethod
+    def shutdown_pool():
+        if thumbnails._cache is not None and thumbnails._cache.pool is not None:
+            thumbnails._cache.pool.shutdown()
+        thumbnails._cache = None
+
+    def cached_files(self):
+        return [name for _, _, names in os.walk(self.cache_dir.name) for name in names]
+
+    def test_serializer_urls(self):
+        data = self.client.get(reverse('baby-detail', args=[self.baby.pk])).json()
+        self.assertEqual(
+            data['thumbnails']['64'], '/manger/thumbnails/64/babies/petr.jpg?v=%s' % thumbnails.get_version(self.baby.photo),
+        )
+        self.assertSetEqual(set(data['thumbnails']), {str(size) for size in settings.MANGER_THUMBNAIL_SIZES})
+
+        # быстрый список отдает те же ссылки и не читает оригиналы
+        Baby.objects.create(name='Иван', gender=Baby.GENDER_MALE, birthday='2010-10-02')
+        with mock.patch.object(thumbnails.hashlib, 'sha256') as sha256:
+            rows = self.client.get(reverse('baby-list')).json()
+            sha256.assert_not_called()
+        self.assertDictEqual(rows[0], data)
+        self.assertIsNone(rows[1]['thumbnails'])
+
+    def test_thumbnail(self):
+        url = thumbnails.get_urls(self.baby.photo)['64']
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=%d' % settings.MANGER_THUMBNAIL_MAX_AGE)
+        self.assertEqual(Image.open(BytesIO(response.content)).size, (64, 64))
+        self.assertEqual(len(self.cached_files()), 1)
+
+        # повторный запрос читает кеш без пула
+        with mock.patch.object(thumbnails, 'ProcessPoolExecutor') as pool:
+            thumbnails._cache.pool = None
+            self.assertEqual(self.client.get(url).content, response.content)
+            pool.assert_not_called()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_replaced_photo(self):
+        url = thumbnails.get_urls(self.baby.photo)['64']
+        self.assertEqual(self.client.get(url)['Cache-Control'], 'public, max-age=%d' % settings.MANGER_THUMBNAIL_MAX_AGE)
+        self.assertEqual(self.client.get(url.split('?')[0])['Cache-Control'], 'no-cache')
+
+        # замена файла по тому же пути меняет ссылку, старая больше не кешируется надолго
+        Image.new('RGB', (800, 600), (10, 200, 10)).save(os.path.join(self.photos.name, 'babies', 'petr.jpg'))
+        os.utime(os.path.join(self.photos.name, 'babies', 'petr.jpg'), ns=(0, 0))
+        self.assertNotEqual(thumbnails.get_urls(self.baby.photo)['64'], url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_not_found(self):
+        for url in (
+            '/manger/thumbnails/65/babies/petr.jpg',
+            '/manger/thumbnails/64/babies/ivan.jpg',
+            '/manger/thumbnails/64/../%s' % os.path.basename(self.cache_dir.name),
+        ):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND, url)
+
+        with open(os.path.join(self.photos.name, 'babies', 'broken.jpg'), 'wb') as photo:
+            photo.write(b'not an image')
+        self.assertEqual(
+            self.client.get('/manger/thumbnails/64/babies/broken.jpg').status_code, status.HTTP_404_NOT_FOUND,
+        )
+
+    def test_digests_limit(self):
+        other = os.path.join(self.photos.name, 'babies', 'ivan.jpg')
+        Image.new('RGB', (80, 60)).save(other)
+        cache = thumbnails.get_cache()
+        with mock.patch.object(thumbnails, 'DIGESTS_SIZE', 1):
+            cache.get_digest(thumbnails.get_source(self.baby.photo))
+            cache.get_digest(other)
+        self.assertListEqual([key[0] for key in cache.digests], [other])
+
+    def test_eviction(self):
+        with override_settings(MANGER_THUMBNAIL_CACHE_SIZE=1):
+            for size in settings.MANGER_THUMBNAIL_SIZES:
+                self.assertEqual(self.client.get(thumbnails.get_urls(self.baby.photo)[str(size)]).status_code, 200)
+                self.assertLessEqual(len(self.cached_files()), 1)
+
+
+class BabyCacheTests(APITestCase):
+    URL_JOURNAL_LIST = reverse('journal-list')
+
+    def setUp(self):
+        self.baby = Baby.objects.create(name='Петр', gender=Baby.GENDER_MALE, birthday='2010-10-01', grade=3)
+
+    def test_get(self):
+        baby = baby_cache.get(self.baby.pk)
+        self.assertEqual((baby.pk, baby.name, baby.grade), (self.baby.pk, 'Петр', 3))
+
+        with self.assertNumQueries(0):
+            self.assertIsNot(baby_cache.get(self.baby.pk), baby)
+
+        # ребенок не из кеша ищется в базе
+        with self.assertNumQueries(1):
+            self.assertIsNone(baby_cache.get(self.baby.pk + 1))
+
+    def test_journal_write_without_lookup(self):
+        baby_cache.get(self.baby.pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.URL_JOURNAL_LIST, {'baby': self.baby.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse([query for query in queries if 'FROM "manger_baby"' in query['sql']])
+
+    def test_invalidation(self):
+        baby_cache.get(self.baby.pk)
+        self.baby.grade = 4
+        self.baby.save()
+        self.assertEqual(baby_cache.get(self.baby.pk).grade, 4)
+
+        pk = self.baby.pk
+        self.baby.delete()
+        response = self.client.post(self.URL_JOURNAL_LIST, {'baby': pk})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('baby', response.json())
+
+    def test_ttl(self):
+        baby_cache.get(self.baby.pk)
+        # запись в обход сигналов, как из другого процесса
+        Baby.objects.filter(pk=self.baby.pk).update(grade=5)
+        self.assertEqual(baby_cache.get(self.baby.pk).grade, 3)
+
+        expired = time.monotonic() + settings.MANGER_BABY_CACHE_TTL + 1
+        with mock.patch('manger.babies.time.monotonic', return_value=expired):
+            self.assertEqual(baby_cache.get(self.baby.pk).grade, 5)
+
+
+class BabyCacheCommitTests(TransactionTestCase):
+    URL_JOURNAL_LIST = reverse('journal-list')
+
+    def setUp(self):
+        baby_cache.clear()
+        self.addCleanup(baby_cache.clear)
+        self.baby = Baby.objects.create(name='Петр', gender=Baby.GENDER_MALE, birthday='2010-10-01')
+
+    def test_deleted_baby(self):
+        baby_cache.get(self.baby.pk)
+        # удаление в обход сигналов, как из другого процесса: кеш еще помнит ребенка
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM manger_baby WHERE id = %s', [self.baby.pk])
+
+        response = self.client.post(self.URL_JOURNAL_LIST, {
+            'baby': self.baby.pk, 'income_time': '2010-02-01 08:00:00', 'income_escort': Journal.ESCORT_FATHER,
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('baby', response.json())
+        self.assertFalse(Journal.objects.exists())
+
+
+class ASGITests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.baby = Baby.objects.create(name='Петр', gender=Baby.GENDER_MALE, birthday='2010-10-01')
+        self.app = ASGIHandler(threads=1)
+        self.addCleanup(self.app.pool.shutdown)
+
+    def request(self, path, query='', method='GET', body=b'', headers=()):
+        messages = []
+        chunks = list(body) if isinstance(body, list) else [body]
+
+        async def receive():
+            return {'type': 'http.request', 'body': chunks.pop(0), 'more_body': bool(chunks)}
+
+        async def send(message):
+            messages.append(message)
+
+        async def run():
+            await self.app(bench.make_scope(path, query, method, headers), receive, send)
+
+        asyncio.run(run())
+        return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+    def test_read(self):
+        status_code, content = self.request(reverse('baby-detail', args=[self.baby.pk]))
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(content)['name'], 'Петр')
+
+        status_code, content = self.request(reverse('baby-list'), headers=[('accept', 'application/msgpack')])
+        self.assertEqual(msgpack.unpackb(content)[0]['id'], self.baby.pk)
+
+    def test_write(self):
+        body = json.dumps({'baby': self.baby.pk}).encode()
+        status_code, _ = self.request(
+            reverse('journal-list'), method='POST', body=body,
+            headers=[('content-type', 'application/json'), ('content-length', str(len(body)))],
+        )
+        self.assertEqual(status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Journal.objects.filter(baby=self.baby).exists())
+
+    def test_write_chunked(self):
+        body = json.dumps({'name': 'Анна', 'gender': Baby.GENDER_FEMALE, 'birthday': '2011-01-01'}).encode()
+        status_code, content = self.request(
+            reverse('baby-list'), method='POST', body=[body[:10], body[10:]],
+            headers=[('content-type', 'application/json')],
+        )
+        self.assertEqual(status_code, status.HTTP_201_CREATED, content)
+        self.assertTrue(Baby.objects.filter(name='Анна').exists())
+
+    def test_streaming(self):
+        Journal.objects.create(baby=self.baby)
+        status_code, content = self.request(reverse('journal-export'), 'type=ndjson')
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(content)['baby'], self.baby.pk)
+
+    def test_long_poll_without_threads(self):
+        since = feed.broker.format_id(feed.broker.seq)
+
+        async def run():
+            polls = [
+                asyncio.ensure_future(bench.call_asgi(self.app, reverse('feed'), 'since=%s&timeout=5' % since))
+                for _ in range(3)
+            ]
+            await asyncio.sleep(0.05)
+            # единственный поток пула свободен, пока long-poll ждут
+            start = time.monotonic()
+            self.assertEqual(await bench.call_asgi(self.app, reverse('baby-list')), status.HTTP_200_OK)
+            feed.broker.publish(feed.UPDATED, 'baby', self.baby.pk)
+            self.assertListEqual(await asyncio.gather(*polls), [status.HTTP_200_OK] * 3)
+            return time.monotonic() - start
+
+        self.assertLess(asyncio.run(run()), 2)
+
+    def test_stream(self):
+        chunks = []
+
+        async def run():
+            disconnect = asyncio.Event()
+            received = []
+
+            async def receive():
+                if not received:
+                    received.append(True)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                chunks.append(message.get('body', b''))
+                if len(chunks) == 2:
+                    feed.broker.publish(feed.UPDATED, 'baby', self.baby.pk)
+                if len(chunks) == 3:
+                    disconnect.set()
+
+            await asyncio.wait_for(self.app(bench.make_scope(reverse('feed-stream')), receive, send), 5)
+
+        asyncio.run(run())
+        self.assertTrue(chunks[1].startswith(b'retry:'))
+        self.assertIn(b'event: updated', chunks[2])
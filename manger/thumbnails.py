@@ -0,0 +1,250 @@
+"""
+Миниатюры фотографий детей.
+
+``Baby.photo`` — путь к оригиналу относительно ``MANGER_PHOTO_ROOT``.
+Миниатюра каждого из размеров ``MANGER_THUMBNAIL_SIZES`` (квадрат со
+стороной в пикселях) создается при первом запросе в пуле процессов и
+сохраняется в ``MANGER_THUMBNAIL_CACHE`` под именем из хеша содержимого
+оригинала и размера: одинаковые файлы делят миниатюры, а замена файла по
+тому же пути дает новое имя. Когда кеш превышает
+``MANGER_THUMBNAIL_CACHE_SIZE`` байт, удаляются давно не читанные файлы.
+
+Ссылки на миниатюры содержат версию оригинала ``?v=`` из времени изменения
+и размера файла — один stat, без чтения оригинала при выдаче списка детей.
+``MANGER_THUMBNAIL_MAX_AGE`` отдается только по ссылке с текущей версией,
+без нее или со старой версией клиент перепроверяет миниатюру по ETag.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.http import parse_etags, quote_etag
+
+CONTENT_TYPE = 'image/jpeg'
+JPEG_QUALITY = 85
+# после очистки кеш занимает не больше этой доли лимита
+EVICT_TO = 0.9
+# сколько хешей оригиналов помнить
+DIGESTS_SIZE = 10000
+
+
+def render(source, target, size):
+    """
+    Выполняется в процессе пула: квадратная миниатюра ``size`` x ``size``
+    по центру оригинала. Файл появляется атомарно через переименование.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(image.convert('RGB'), (size, size), Image.LANCZOS)
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        os.replace(path, target)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return os.path.getsize(target)
+
+
+class ThumbnailCache:
+    def __init__(self, root, max_size, workers):
+        self.root = root
+        self.max_size = max_size
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pending = {}
+        # (путь, mtime, размер) оригинала -> хеш содержимого, давно не нужные вытесняются
+        self.digests = OrderedDict()
+        self.size = None
+
+    def get_digest(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            digest = self.digests.get(key)
+            if digest is not None:
+                self.digests.move_to_end(key)
+                return digest
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(1 << 20), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        with self.lock:
+            self.digests[key] = digest
+            if len(self.digests) > DIGESTS_SIZE:
+                self.digests.popitem(last=False)
+        return digest
+
+    def get_path(self, digest, size):
+        return os.path.join(self.root, digest[:2], '%s-%d.jpg' % (digest, size))
+
+    def get(self, source, size):
+        """
+        ``(хеш оригинала, путь к миниатюре)``; создает миниатюру, если ее нет.
+        Одновременные запросы одной миниатюры ждут одну задачу пула.
+        """
+        digest = self.get_digest(source)
+        target = self.get_path(digest, size)
+        try:
+            # время изменения служит временем последнего чтения для очистки
+            os.utime(target)
+            return digest, target
+        except FileNotFoundError:
+            pass
+
+        with self.lock:
+            future = self.pending.get(target)
+            if future is None:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(self.workers)
+                future = self.pending[target] = self.pool.submit(render, source, target, size)
+        try:
+            written = future.result()
+        finally:
+            with self.lock:
+                self.pending.pop(target, None)
+
+        self.add(written, target)
+        return digest, target
+
+    def scan(self):
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def add(self, written, target):
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.scan())
+            else:
+                self.size += written
+            if self.size > self.max_size:
+                self.evict(keep=target)
+
+    def evict(self, keep=None):
+        # размер пересчитывается по диску: файлы могли писать и другие процессы
+        files = sorted(self.scan())
+        self.size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.size <= self.max_size * EVICT_TO:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None or _cache.root != settings.MANGER_THUMBNAIL_CACHE:
+            _cache = ThumbnailCache(
+                settings.MANGER_THUMBNAIL_CACHE, settings.MANGER_THUMBNAIL_CACHE_SIZE, settings.MANGER_THUMBNAIL_WORKERS,
+            )
+        return _cache
+
+
+def get_source(photo):
+    """
+    Абсолютный путь оригинала; пути вне ``MANGER_PHOTO_ROOT`` не допускаются.
+    """
+    root = os.path.realpath(settings.MANGER_PHOTO_ROOT)
+    path = os.path.realpath(os.path.join(root, photo.lstrip('/')))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def get_source_version(source):
+    stat = os.stat(source)
+    return '%x-%x' % (stat.st_mtime_ns, stat.st_size)
+
+
+def get_version(photo):
+    """
+    Версия оригинала для ссылки или ``None``, если файла нет.
+    """
+    source = get_source(photo)
+    if source is None:
+        return None
+    try:
+        return get_source_version(source)
+    except OSError:
+        return None
+
+
+@lru_cache()
+def get_prefixes(sizes):
+    return [(str(size), reverse('thumbnail', kwargs={'size': size, 'photo': 'x'})[:-1]) for size in sizes]
+
+
+def get_urls(photo):
+    """
+    Ссылки на миниатюры по размерам; ``None`` для ребенка без фото.
+    """
+    if not photo:
+        return None
+    version = get_version(photo)
+    path = quote(photo.lstrip('/')) + ('?v=%s' % version if version else '')
+    return {size: prefix + path for size, prefix in get_prefixes(tuple(settings.MANGER_THUMBNAIL_SIZES))}
+
+
+def thumbnail_view(request, size, photo):
+    if size not in settings.MANGER_THUMBNAIL_SIZES:
+        raise Http404
+    source = get_source(photo)
+    if source is None:
+        raise Http404
+
+    try:
+        # версия берется до чтения: если файл заменят во время запроса, долгий кеш получит только старая ссылка
+        version = get_source_version(source)
+        digest, path = get_cache().get(source, size)
+        etag = quote_etag('%s-%d' % (digest, size))
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponse(status=304)
+        else:
+            with open(path, 'rb') as thumbnail:
+                response = HttpResponse(thumbnail.read(), content_type=CONTENT_TYPE)
+    except OSError:
+        # не картинка или файл удален во время чтения
+        raise Http404
+
+    response['ETag'] = etag
+    if request.GET.get('v') == version:
+        response['Cache-Control'] = 'public, max-age=%d' % settings.MANGER_THUMBNAIL_MAX_AGE
+    else:
+        # ссылка без версии или на замененный оригинал: кешировать можно только с проверкой
+        response['Cache-Control'] = 'no-cache'
+    return response